@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+import subprocess
+from pathlib import Path
+
+import numpy as np
+from constants import BYTES_TO_GB
+
+SAMPLE_RATE = 16000
+PARTIAL_HASH_BYTES = 1024 * 1024
+
+
+class AudioCache:
+    """
+    On-disk cache of decoded 16 kHz mono float32 PCM, one raw file per video.
+    Entries are keyed by the video's size, mtime and a hash of its first MB,
+    read back through numpy.memmap and evicted in LRU order (by access time)
+    once the cache grows past max_size.
+    """
+
+    def __init__(self, cache_path="../DB/AudioCache/", max_size=20 * BYTES_TO_GB):
+        self.cache_path = Path(cache_path)
+        self.max_size = max_size
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    def get_key(self, video_path):
+        stat = Path(video_path).stat()
+        digest = hashlib.sha1()
+        digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        with open(video_path, "rb") as f:
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+        return digest.hexdigest()
+
+    def get_entry_path(self, video_path):
+        return self.cache_path / f"{self.get_key(video_path)}.f32"
+
+    def load_audio(self, video_path):
+        """Return the decoded audio of video_path, decoding it only on a cache miss."""
+        entry_path = self.get_entry_path(video_path)
+        if entry_path.exists():
+            logging.info(f"Audio cache hit for {video_path}")
+            os.utime(entry_path)
+        else:
+            logging.info(f"Audio cache miss for {video_path}, decoding...")
+            self.decode(video_path, entry_path)
+            self.evict()
+        return self.read(entry_path)
+
+    def read(self, entry_path):
+        # copy-on-write keeps the array writable (torch.from_numpy warns on
+        # read-only buffers) without copying or ever modifying the cache file
+        if entry_path.stat().st_size == 0:
+            return np.zeros(0, dtype=np.float32)
+        return np.memmap(entry_path, dtype=np.float32, mode="c")
+
+    def decode(self, video_path, entry_path):
+        tmp_path = entry_path.with_suffix(".tmp")
+        cmd = [
+            "ffmpeg",
+            "-nostdin",
+            "-threads", "0",
+            "-y",
+            "-i", str(video_path),
+            "-f", "f32le",
+            "-ac", "1",
+            "-acodec", "pcm_f32le",
+            "-ar", str(SAMPLE_RATE),
+            str(tmp_path),
+        ]
+        try:
+            subprocess.run(cmd, capture_output=True, check=True)
+        except subprocess.CalledProcessError as e:
+            tmp_path.unlink(missing_ok=True)
+            raise RuntimeError(f"Failed to decode audio: {e.stderr.decode()}") from e
+        os.replace(tmp_path, entry_path)
+
+    def get_cache_size(self):
+        return sum(entry.stat().st_size for entry in self.cache_path.glob("*.f32"))
+
+    def evict(self, max_size=None):
+        """
+        Remove least recently used entries until the cache fits in max_size
+        (self.max_size by default). Returns the bytes freed.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        entries = sorted(
+            self.cache_path.glob("*.f32"), key=lambda entry: entry.stat().st_mtime
+        )
+        total_size = sum(entry.stat().st_size for entry in entries)
+        freed = 0
+        # the newest entry is the one just decoded, never evict it
+        for entry in entries[:-1]:
+            if total_size <= max_size:
+                break
+            size = entry.stat().st_size
+            total_size -= size
+            freed += size
+            entry.unlink(missing_ok=True)
+            logging.info(f"Evicted {entry.name} from audio cache")
+        return freed
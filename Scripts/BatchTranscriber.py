@@ -0,0 +1,173 @@
+import logging
+from pathlib import Path
+
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE
+from whisper.tokenizer import get_tokenizer
+
+from TranscriptStore import transcript_exists
+
+WINDOW_SECONDS = N_SAMPLES / SAMPLE_RATE
+TIME_PRECISION = 0.02
+
+
+class BatchTranscriber:
+    """
+    Batched inference on top of a Transcriber: the 30 s mel windows of many videos
+    are stacked into one encoder/decoder batch so the GPU is kept busy, and the
+    decoded windows are routed back to their file. Windows are cut at a fixed
+    30 s stride and decoded without the previous window as prompt, which is what
+    makes them independent enough to batch; outputs go to the same files as
+    Transcriber.transcribe_video.
+    """
+
+    def __init__(self, transcriber, batch_size=16, beam_size=None):
+        self.transcriber = transcriber
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+
+    @property
+    def model(self):
+        return self.transcriber.model
+
+    def get_windows(self, audio):
+        """Split the log-mel spectrogram of audio into padded 30 s windows."""
+        mel = whisper.log_mel_spectrogram(audio, self.model.dims.n_mels, padding=N_SAMPLES)
+        content_frames = mel.shape[-1] - N_FRAMES
+        return [
+            whisper.pad_or_trim(mel[:, seek : seek + N_FRAMES], N_FRAMES)
+            for seek in range(0, max(content_frames, 1), N_FRAMES)
+        ]
+
+    def detect_languages(self, first_windows):
+        """Detect the language of every file from its first window, in one batch."""
+        dtype = torch.float16 if self.model.device.type == "cuda" else torch.float32
+        mel = torch.stack(first_windows).to(self.model.device, dtype)
+        _, probs = self.model.detect_language(mel)
+        return [max(p, key=p.get) for p in probs]
+
+    def decode_windows(self, windows, language):
+        """Decode windows in batches of batch_size. Returns one DecodingResult per window."""
+        options = whisper.DecodingOptions(
+            language=language,
+            beam_size=self.beam_size,
+            fp16=self.model.device.type == "cuda",
+        )
+        dtype = torch.float16 if options.fp16 else torch.float32
+        results = []
+        for i in range(0, len(windows), self.batch_size):
+            batch = torch.stack(windows[i : i + self.batch_size]).to(self.model.device, dtype)
+            results.extend(self.model.decode(batch, options))
+        return results
+
+    def split_segments(self, result, offset, tokenizer):
+        """Turn the timestamp tokens of a decoded window into segments in file time."""
+        segments = []
+        start = None
+        text_tokens = []
+        for token in result.tokens:
+            if token >= tokenizer.timestamp_begin:
+                time = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+                if start is not None and text_tokens:
+                    segments.append((start, time, text_tokens))
+                    start, text_tokens = None, []
+                else:
+                    start = time
+            elif token < tokenizer.eot:
+                text_tokens.append(token)
+        if text_tokens:
+            segments.append((start or 0.0, WINDOW_SECONDS, text_tokens))
+
+        return [
+            {
+                "start": offset + seg_start,
+                "end": offset + seg_end,
+                "text": tokenizer.decode(tokens),
+                "tokens": tokens,
+                "avg_logprob": result.avg_logprob,
+                "no_speech_prob": result.no_speech_prob,
+                "compression_ratio": result.compression_ratio,
+            }
+            for seg_start, seg_end, tokens in segments
+        ]
+
+    def build_result(self, decoded, language):
+        """Merge the decoded windows of one file into a whisper-style result."""
+        tokenizer = get_tokenizer(
+            self.model.is_multilingual,
+            num_languages=self.model.num_languages,
+            language=language,
+            task="transcribe",
+        )
+        segments = []
+        for window_index, result in enumerate(decoded):
+            # same silence rule as whisper.transcribe
+            if result.no_speech_prob > 0.6 and result.avg_logprob < -1:
+                continue
+            segments.extend(
+                self.split_segments(result, window_index * N_FRAMES * HOP_LENGTH / SAMPLE_RATE, tokenizer)
+            )
+        for i, segment in enumerate(segments):
+            segment["id"] = i
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": language,
+        }
+
+    def transcribe_videos(self, jobs):
+        """Transcribe a list of (video_path, course_name) jobs in shared batches."""
+        files = []
+        for video_path, course_name in jobs:
+            video_path = Path(video_path)
+            spanish_path, autodetect_path = self.transcriber.get_output_paths(
+                video_path.stem, course_name
+            )
+            if transcript_exists(spanish_path) and transcript_exists(autodetect_path):
+                logging.info(f"Transcriptions already exist for {video_path.stem}, skipping...")
+                continue
+            if not video_path.exists():
+                logging.info(f"Video file not found: {video_path}")
+                continue
+            spanish_path.parent.mkdir(parents=True, exist_ok=True)
+            autodetect_path.parent.mkdir(parents=True, exist_ok=True)
+            audio = self.transcriber.load_audio(video_path)
+            files.append(
+                {
+                    "stem": video_path.stem,
+                    "windows": self.get_windows(audio),
+                    "es": spanish_path,
+                    "ad": autodetect_path,
+                }
+            )
+        if not files:
+            return
+
+        languages = self.detect_languages([f["windows"][0] for f in files])
+
+        # output path -> language, grouped by language so every batch shares its decoding options
+        targets = {}
+        for f, language in zip(files, languages):
+            logging.info(f"Detected language for {f['stem']}: {language}")
+            if not transcript_exists(f["es"]):
+                targets.setdefault("es", []).append((f, [f["es"]]))
+            if not transcript_exists(f["ad"]):
+                if language == "es" and not transcript_exists(f["es"]):
+                    targets["es"][-1][1].append(f["ad"])
+                else:
+                    targets.setdefault(language, []).append((f, [f["ad"]]))
+
+        for language, entries in targets.items():
+            windows = [w for f, _ in entries for w in f["windows"]]
+            logging.info(
+                f"Decoding {len(windows)} windows from {len(entries)} files in batches of {self.batch_size} ({language})"
+            )
+            decoded = self.decode_windows(windows, language)
+            position = 0
+            for f, paths in entries:
+                count = len(f["windows"])
+                result = self.build_result(decoded[position : position + count], language)
+                position += count
+                for path in paths:
+                    self.transcriber.write_transcription(path, result)
@@ -0,0 +1,281 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARKS_PATH = Path("../Benchmarks/")
+FIXTURES_MANIFEST = BENCHMARKS_PATH / "fixtures.json"
+RESULTS_PATH = BENCHMARKS_PATH / "results"
+BASELINE_PATH = BENCHMARKS_PATH / "baseline.json"
+
+# metrics where a higher value is a regression
+COMPARED_METRICS = [
+    "load_seconds",
+    "peak_rss_mb",
+    "real_time_factor",
+    "decode_seconds",
+    "mel_seconds",
+    "encode_seconds",
+    "decode_tokens_seconds",
+    "wer",
+]
+
+
+def load_manifest():
+    with open(FIXTURES_MANIFEST, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_fixtures():
+    """
+    Return [(wav path, reference text)] of the committed fixture set. The clips are
+    Spanish speech synthesized from pln subtitles (see the manifest), so they ship
+    with the repo and need neither the lecture videos nor ffmpeg.
+    """
+    fixtures = [
+        (BENCHMARKS_PATH / fixture["file"], fixture["text"])
+        for fixture in load_manifest()["fixtures"]
+    ]
+    missing = [str(path) for path, _ in fixtures if not path.exists()]
+    if missing:
+        raise FileNotFoundError(f"Missing fixtures {missing}")
+    return fixtures
+
+
+def read_wav(path):
+    """Read a 16-bit mono wav as float32 PCM, the format whisper.load_audio returns."""
+    import numpy as np
+
+    with wave.open(str(path), "rb") as f:
+        pcm = f.readframes(f.getnframes())
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+def benchmark_config(model_name, backend, fixture_paths, checkpoint_seconds=None):
+    """
+    Benchmark one (model, backend) pair. Runs in its own process so peak RSS is per config.
+    With checkpoint_seconds the fixtures are also transcribed as one clip, with and
+    without checkpoints, to compare the checkpointed decoding with model.transcribe.
+    """
+    import torch
+    import whisper
+    from Transcriber import Transcriber
+    from whisper.audio import N_FRAMES, N_SAMPLES, SAMPLE_RATE
+
+    def sync():
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    start = time.perf_counter()
+    transcriber = Transcriber(model_name=model_name, backend=backend)
+    model = transcriber.model
+    load_seconds = time.perf_counter() - start
+
+    fp16 = model.device.type == "cuda"
+    dtype = torch.float16 if fp16 else torch.float32
+    stages = {"decode": 0.0, "mel": 0.0, "encode": 0.0, "decode_tokens": 0.0, "transcribe": 0.0}
+    audio_seconds = 0.0
+    windows = 0
+    texts = []
+
+    for fixture_path in fixture_paths:
+        start = time.perf_counter()
+        audio = read_wav(fixture_path)
+        stages["decode"] += time.perf_counter() - start
+        audio_seconds += len(audio) / SAMPLE_RATE
+
+        start = time.perf_counter()
+        mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+        batch = torch.stack(
+            [
+                whisper.pad_or_trim(mel[:, seek : seek + N_FRAMES], N_FRAMES)
+                for seek in range(0, max(mel.shape[-1] - N_FRAMES, 1), N_FRAMES)
+            ]
+        ).to(model.device, dtype)
+        stages["mel"] += time.perf_counter() - start
+        windows += len(batch)
+
+        with torch.no_grad():
+            start = time.perf_counter()
+            features = model.encoder(batch)
+            sync()
+            stages["encode"] += time.perf_counter() - start
+
+            # decode() skips the encoder when it is handed audio features
+            start = time.perf_counter()
+            model.decode(features, whisper.DecodingOptions(language="es", fp16=fp16))
+            sync()
+            stages["decode_tokens"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        texts.append(model.transcribe(audio, language="es", fp16=fp16)["text"])
+        sync()
+        stages["transcribe"] += time.perf_counter() - start
+
+    return {
+        "model": model_name,
+        "backend": backend,
+        "device": str(model.device),
+        "audio_seconds": audio_seconds,
+        "windows": windows,
+        "load_seconds": load_seconds,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "real_time_factor": stages["transcribe"] / audio_seconds,
+        "windows_per_second": windows / (stages["encode"] + stages["decode_tokens"]),
+        **{f"{stage}_seconds": seconds for stage, seconds in stages.items()},
+        "texts": texts,
+        **(
+            compare_checkpoints(transcriber, fixture_paths, checkpoint_seconds, fp16)
+            if checkpoint_seconds
+            else {}
+        ),
+    }
+
+
+def compare_checkpoints(transcriber, fixture_paths, checkpoint_seconds, fp16):
+    """Transcribe the fixtures joined in one clip, so windows end mid-speech, with both paths."""
+    import numpy as np
+
+    audio = np.concatenate([read_wav(path) for path in fixture_paths])
+    plain = transcriber.model.transcribe(audio, language="es", fp16=fp16)["text"]
+    transcriber.checkpoint_seconds = checkpoint_seconds
+    with tempfile.TemporaryDirectory() as tmp_path:
+        checkpointed = transcriber.transcribe_with_checkpoints(
+            audio, Path(tmp_path) / "benchmark.partial.jsonl", language="es", fp16=fp16
+        )["text"]
+    return {"joined_text": plain, "checkpoint_text": checkpointed}
+
+
+def get_wer(references, hypotheses):
+    """WER of the transcribed fixtures against their subtitle text, as one corpus."""
+    import jiwer
+    from metrics import normalize_text
+
+    return jiwer.wer(
+        [normalize_text(text) for text in references],
+        [normalize_text(text) for text in hypotheses],
+    )
+
+
+def run(model_names, backends, checkpoint_seconds=None):
+    fixtures = get_fixtures()
+    fixture_paths = [path for path, _ in fixtures]
+    references = [text for _, text in fixtures]
+    results = []
+    for model_name in model_names:
+        for backend in backends:
+            logging.info(f"Benchmarking {model_name} ({backend})")
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                result = executor.submit(
+                    benchmark_config, model_name, backend, fixture_paths, checkpoint_seconds
+                ).result()
+            # WER is computed here, importing jiwer in the worker would add to its peak RSS
+            result["wer"] = get_wer(references, result.pop("texts"))
+            if checkpoint_seconds:
+                reference = " ".join(references)
+                result["joined_wer"] = get_wer([reference], [result.pop("joined_text")])
+                result["checkpoint_wer"] = get_wer([reference], [result.pop("checkpoint_text")])
+                logging.info(
+                    f"{model_name} ({backend}): WER {result['joined_wer']:.3f} with model.transcribe, "
+                    f"{result['checkpoint_wer']:.3f} with {checkpoint_seconds} s checkpoints"
+                )
+            logging.info(
+                f"{model_name} ({backend}): RTF {result['real_time_factor']:.3f}, "
+                f"load {result['load_seconds']:.1f} s, peak RSS {result['peak_rss_mb']:.0f} MB, "
+                f"WER {result['wer']:.3f}"
+            )
+            results.append(result)
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "machine": platform.node(),
+        "processor": platform.processor(),
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Return the metrics that got worse than the baseline by more than tolerance."""
+    baseline_results = {(r["model"], r["backend"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        previous = baseline_results.get((result["model"], result["backend"]))
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if previous.get(metric) and result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    {
+                        "model": result["model"],
+                        "backend": result["backend"],
+                        "metric": metric,
+                        "baseline": previous[metric],
+                        "current": result[metric],
+                        "change": result[metric] / previous[metric] - 1,
+                    }
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcription benchmark")
+    parser.add_argument("--models", nargs="+", default=["tiny", "base", "small", "medium"])
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8"])
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument(
+        "--checkpoint-seconds",
+        type=float,
+        help="also compare the WER of checkpointed transcription with model.transcribe",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store this run as the baseline instead of comparing against it",
+    )
+    args = parser.parse_args()
+
+    report = run(args.models, args.backends, args.checkpoint_seconds)
+    RESULTS_PATH.mkdir(parents=True, exist_ok=True)
+    report_path = RESULTS_PATH / f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Benchmark results saved to {report_path}")
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Baseline saved to {BASELINE_PATH}")
+        return
+    if not BASELINE_PATH.exists():
+        logging.info(
+            f"No baseline at {BASELINE_PATH}, nothing to compare against. "
+            "Create it on the reference machine with --save-baseline"
+        )
+        raise SystemExit(1)
+
+    with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    for regression in regressions:
+        logging.info(
+            f"REGRESSION {regression['model']} ({regression['backend']}) {regression['metric']}: "
+            f"{regression['baseline']:.3f} -> {regression['current']:.3f} ({regression['change']:+.0%})"
+        )
+    if regressions:
+        raise SystemExit(1)
+    logging.info("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    main()
@@ -0,0 +1,449 @@
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path, PureWindowsPath
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    acronym TEXT PRIMARY KEY,
+    name TEXT,
+    position INTEGER
+);
+CREATE TABLE IF NOT EXISTS classes (
+    course TEXT NOT NULL REFERENCES courses(acronym),
+    number TEXT NOT NULL,
+    url TEXT,
+    expected_size INTEGER,
+    validated INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (course, number)
+);
+CREATE TABLE IF NOT EXISTS transcriptions (
+    course TEXT NOT NULL,
+    number TEXT NOT NULL,
+    model TEXT NOT NULL,
+    language TEXT NOT NULL,
+    path TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (course, number, model, language)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    name TEXT PRIMARY KEY,
+    last_run TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS verdicts (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    reason TEXT
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    course TEXT NOT NULL,
+    number TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (course, number)
+);
+CREATE INDEX IF NOT EXISTS classes_validated ON classes (course, validated);
+CREATE INDEX IF NOT EXISTS classes_expected_size ON classes (expected_size);
+"""
+
+# Columns added after the first release, created on catalogs that predate them
+MIGRATIONS = {
+    "courses": {
+        "etag": "TEXT",
+        "last_modified": "TEXT",
+        "last_scraped": "TEXT",
+    },
+}
+
+
+def split_video_stem(video_stem):
+    """Split '<course>_<nn>' (course acronyms may contain '_' or '-') into its parts."""
+    course, number = video_stem.rsplit("_", 1)
+    return course, number
+
+
+class Catalog:
+    """
+    Embedded SQLite catalog of courses, classes, validation and transcription state.
+    Every public method runs in its own transaction unless it is called inside
+    transaction(), which batches all the updates into a single commit. The
+    connection is opened lazily per process so a Catalog can be handed to
+    worker processes.
+    """
+
+    def __init__(self, db_path="../DB/catalog.sqlite3", journal_mode="WAL"):
+        self.db_path = Path(db_path)
+        # WAL needs shared memory between the processes, use "DELETE" when
+        # several nodes open the catalog over a network filesystem. DELETE still
+        # relies on POSIX byte-range locks, which NFS only honours with a working
+        # lock manager (lockd or NFSv4) on every node
+        self.journal_mode = journal_mode
+        self._connection = None
+        self._pid = None
+        self.lock = threading.RLock()
+        self.depth = 0
+
+    def __getstate__(self):
+        return {"db_path": self.db_path, "journal_mode": self.journal_mode}
+
+    def __setstate__(self, state):
+        self.__init__(state["db_path"], state["journal_mode"])
+
+    @property
+    def connection(self):
+        if self._connection is None or self._pid != os.getpid():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False, timeout=30
+            )
+            self._connection.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+            self.migrate(self._connection)
+            self._pid = os.getpid()
+        return self._connection
+
+    def migrate(self, connection):
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns.items():
+                if column not in existing:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        connection.commit()
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            connection = self.connection
+            self.depth += 1
+            try:
+                yield connection
+                if self.depth == 1:
+                    connection.commit()
+            except Exception:
+                if self.depth == 1:
+                    connection.rollback()
+                raise
+            finally:
+                self.depth -= 1
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    # Courses
+
+    def set_courses(self, acronyms, names):
+        with self.transaction() as db:
+            db.executemany(
+                """
+                INSERT INTO courses (acronym, name, position) VALUES (?, ?, ?)
+                ON CONFLICT (acronym) DO UPDATE SET
+                    name = COALESCE(excluded.name, courses.name),
+                    position = excluded.position
+                """,
+                [
+                    (acronym, names[i] if i < len(names) else None, i)
+                    for i, acronym in enumerate(acronyms)
+                ],
+            )
+
+    def get_course_acronyms(self):
+        return [row[0] for row in self.query("SELECT acronym FROM courses ORDER BY position, acronym")]
+
+    # Classes
+
+    def get_course_freshness(self, course):
+        """Return (etag, last_modified, last_scraped) of the course page."""
+        rows = self.query(
+            "SELECT etag, last_modified, last_scraped FROM courses WHERE acronym = ?",
+            (course,),
+        )
+        return rows[0] if rows else (None, None, None)
+
+    def set_course_freshness(self, course, etag=None, last_modified=None):
+        """Mark the course page as scraped now, keeping validators the server didn't resend."""
+        with self.transaction() as db:
+            db.execute("INSERT OR IGNORE INTO courses (acronym) VALUES (?)", (course,))
+            db.execute(
+                """
+                UPDATE courses SET
+                    etag = COALESCE(?, etag),
+                    last_modified = COALESCE(?, last_modified),
+                    last_scraped = ?
+                WHERE acronym = ?
+                """,
+                (etag, last_modified, datetime.now().isoformat(), course),
+            )
+
+    def set_classes(self, course, numbers):
+        """Add the classes of a course and return the numbers that weren't catalogued yet."""
+        with self.transaction() as db:
+            db.execute("INSERT OR IGNORE INTO courses (acronym) VALUES (?)", (course,))
+            existing = {
+                row[0]
+                for row in db.execute("SELECT number FROM classes WHERE course = ?", (course,))
+            }
+            new_numbers = [
+                number
+                for number in dict.fromkeys(n.zfill(2) for n in numbers)
+                if number not in existing
+            ]
+            db.executemany(
+                "INSERT INTO classes (course, number) VALUES (?, ?)",
+                [(course, number) for number in new_numbers],
+            )
+        return new_numbers
+
+    def get_class_numbers(self, course):
+        return [
+            row[0]
+            for row in self.query(
+                "SELECT number FROM classes WHERE course = ? ORDER BY CAST(number AS INTEGER)",
+                (course,),
+            )
+        ]
+
+    def get_classes(self):
+        """Return (course, number, expected_size) for every catalogued class, in course order."""
+        return self.query(
+            """
+            SELECT classes.course, classes.number, classes.expected_size
+            FROM classes LEFT JOIN courses ON courses.acronym = classes.course
+            ORDER BY courses.position, classes.course, CAST(classes.number AS INTEGER)
+            """
+        )
+
+    def set_expected_sizes(self, course, sizes):
+        """sizes maps class number to (url, expected_size)."""
+        with self.transaction() as db:
+            db.executemany(
+                """
+                INSERT INTO classes (course, number, url, expected_size) VALUES (?, ?, ?, ?)
+                ON CONFLICT (course, number) DO UPDATE SET
+                    url = excluded.url, expected_size = excluded.expected_size
+                """,
+                [(course, number, url, size) for number, (url, size) in sizes.items()],
+            )
+
+    def set_validated(self, course, number, validated=True):
+        with self.transaction() as db:
+            db.execute(
+                """
+                INSERT INTO classes (course, number, validated) VALUES (?, ?, ?)
+                ON CONFLICT (course, number) DO UPDATE SET validated = excluded.validated
+                """,
+                (course, number, int(validated)),
+            )
+
+    def is_validated(self, course, number):
+        rows = self.query(
+            "SELECT validated FROM classes WHERE course = ? AND number = ?",
+            (course, number),
+        )
+        return bool(rows and rows[0][0])
+
+    # Transcriptions
+
+    def set_transcribed(self, course, number, model, language, path):
+        with self.transaction() as db:
+            db.execute(
+                """
+                INSERT OR REPLACE INTO transcriptions
+                    (course, number, model, language, path, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (course, number, model, language, str(path), datetime.now().isoformat()),
+            )
+
+    def record_transcription(self, path):
+        """Record a transcription from its <language>/<course>/<course>_<nn>_<model>.{txt,seg} path."""
+        path = Path(path)
+        video_stem, model = path.stem.rsplit("_", 1)
+        course, number = split_video_stem(video_stem)
+        self.set_transcribed(course, number, model, path.parent.parent.name, path)
+
+    def get_pending_classes(self, model_names, languages=("es", "ad")):
+        """Return (course, number) of the classes missing a transcription for any model and language."""
+        model_marks = ", ".join("?" * len(model_names))
+        language_marks = ", ".join("?" * len(languages))
+        return self.query(
+            f"""
+            SELECT classes.course, classes.number FROM classes
+            LEFT JOIN courses ON courses.acronym = classes.course
+            WHERE (
+                SELECT COUNT(*) FROM transcriptions
+                WHERE transcriptions.course = classes.course
+                    AND transcriptions.number = classes.number
+                    AND model IN ({model_marks}) AND language IN ({language_marks})
+            ) < ?
+            ORDER BY courses.position, classes.course, CAST(classes.number AS INTEGER)
+            """,
+            (*model_names, *languages, len(model_names) * len(languages)),
+        )
+
+    def get_transcribed_counts(self, model_names):
+        """Return {course: number of classes transcribed by any of model_names}."""
+        marks = ", ".join("?" * len(model_names))
+        return dict(
+            self.query(
+                f"SELECT course, COUNT(DISTINCT number) FROM transcriptions WHERE model IN ({marks}) GROUP BY course",
+                tuple(model_names),
+            )
+        )
+
+    def get_transcribed_models(self, course, number, language):
+        return {
+            row[0]
+            for row in self.query(
+                "SELECT model FROM transcriptions WHERE course = ? AND number = ? AND language = ?",
+                (course, number, language),
+            )
+        }
+
+    def get_transcriptions(self, course, number):
+        """Return (model, language, path) of every transcription of a class."""
+        return self.query(
+            "SELECT model, language, path FROM transcriptions WHERE course = ? AND number = ?",
+            (course, number),
+        )
+
+    # Content fingerprints, to recognise the same video published by several courses
+
+    def get_fingerprint(self, course, number, size):
+        """Return the stored fingerprint of a class, if it was computed for a video of this size."""
+        rows = self.query(
+            "SELECT fingerprint FROM fingerprints WHERE course = ? AND number = ? AND size = ?",
+            (course, number, size),
+        )
+        return rows[0][0] if rows else None
+
+    def set_fingerprint(self, course, number, size, fingerprint):
+        with self.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO fingerprints (course, number, size, fingerprint) VALUES (?, ?, ?, ?)",
+                (course, number, size, fingerprint),
+            )
+
+    def get_classes_with_size(self, size):
+        """Return (course, number, url) of the classes whose video has exactly size bytes."""
+        return self.query(
+            "SELECT course, number, url FROM classes WHERE expected_size = ?", (size,)
+        )
+
+    def get_unsized_transcribed_classes(self, model_names):
+        """Return (course, number, url) of the classes transcribed by any of model_names with no expected size."""
+        marks = ", ".join("?" * len(model_names))
+        return self.query(
+            f"""
+            SELECT DISTINCT transcriptions.course, transcriptions.number, classes.url
+            FROM transcriptions
+            LEFT JOIN classes ON classes.course = transcriptions.course
+                AND classes.number = transcriptions.number
+            WHERE transcriptions.model IN ({marks}) AND classes.expected_size IS NULL
+            """,
+            tuple(model_names),
+        )
+
+    # Video validation verdicts
+
+    def get_verdict(self, path, size, mtime_ns):
+        """Return (valid, reason) if path was validated with this size and mtime."""
+        rows = self.query(
+            "SELECT valid, reason FROM verdicts WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (str(path), size, mtime_ns),
+        )
+        if not rows:
+            return None
+        valid, reason = rows[0]
+        return bool(valid), reason
+
+    def set_verdict(self, path, size, mtime_ns, valid, reason=None):
+        with self.transaction() as db:
+            db.execute(
+                """
+                INSERT INTO verdicts (path, size, mtime_ns, valid, reason)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    size = excluded.size,
+                    mtime_ns = excluded.mtime_ns,
+                    valid = excluded.valid,
+                    reason = excluded.reason
+                """,
+                (str(path), size, mtime_ns, int(valid), reason),
+            )
+
+    # Run timestamps
+
+    def should_run(self, name, interval=timedelta(weeks=1)):
+        rows = self.query("SELECT last_run FROM runs WHERE name = ?", (name,))
+        if not rows:
+            return True
+        return datetime.now() - datetime.fromisoformat(rows[0][0]) > interval
+
+    def update_timestamp(self, name, timestamp=None):
+        with self.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO runs (name, last_run) VALUES (?, ?)",
+                (name, (timestamp or datetime.now()).isoformat()),
+            )
+
+    # One-time import of the text-file layout
+
+    def import_legacy(self, db_root="../DB"):
+        """Import the state kept in text files under db_root into the catalog."""
+        db_root = Path(db_root)
+        courses_path = db_root / "CoursesNames"
+        opens_path = db_root / "Opens"
+
+        with self.transaction():
+            acronyms = self.read_lines(courses_path / "course_acronyms.txt")
+            names = self.read_lines(courses_path / "course_names.txt")
+            if acronyms:
+                self.set_courses(acronyms, names)
+
+            for classes_path in sorted(opens_path.glob("*/classes.txt")):
+                numbers = [n for n in self.read_lines(classes_path) if n.isdigit()]
+                self.set_classes(classes_path.parent.name, numbers)
+
+            # the log holds paths like ..\DB\Opens\aali\aali_01.mp4 written on Windows
+            for line in self.read_lines(db_root / "validation_test_pass.txt"):
+                course, number = split_video_stem(PureWindowsPath(line).stem)
+                self.set_validated(course, number)
+
+            for name, timestamp_path in [
+                ("course_scraper", courses_path / "last_run_timestamp.txt"),
+                ("class_scraper", opens_path / "last_run_timestamp.txt"),
+            ]:
+                timestamp = self.read_lines(timestamp_path)
+                if timestamp:
+                    self.update_timestamp(name, datetime.fromisoformat(timestamp[0]))
+
+            transcriptions = 0
+            for language in ["es", "ad"]:
+                paths = (db_root / "Transcripciones" / language).glob("*/*_*_*.*")
+                for path in sorted(p for p in paths if p.suffix in (".txt", ".seg")):
+                    if path.stem.endswith("_human"):
+                        continue
+                    self.record_transcription(path)
+                    transcriptions += 1
+
+        logging.info(
+            f"Imported {len(acronyms)} courses and {transcriptions} transcriptions into {self.db_path}"
+        )
+
+    def read_lines(self, path):
+        if not path.exists():
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    Catalog().import_legacy()
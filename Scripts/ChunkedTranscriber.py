@@ -0,0 +1,129 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from Transcriber import detect_language
+from VoiceActivity import SAMPLE_RATE, VoiceActivityDetector
+
+CONTEXT = multiprocessing.get_context("spawn")
+
+worker_model = None
+
+
+def init_worker(model_name, num_threads):
+    """Load a private CPU copy of the model once per worker process."""
+    global worker_model
+    import torch
+    import whisper
+
+    torch.set_num_threads(num_threads)
+    worker_model = whisper.load_model(model_name, device="cpu")
+
+
+def transcribe_chunk(audio, options):
+    return worker_model.transcribe(audio, fp16=False, **options)
+
+
+def detect_chunk_language(audio):
+    return detect_language(worker_model, audio)
+
+
+class ChunkedTranscriber:
+    """
+    Transcribe one long lecture in parallel on a CPU-only node. The audio is cut
+    at pauses close to every chunk_seconds, the chunks are transcribed by a
+    pool of processes that each hold their own model, and the segments are
+    stitched back with global timestamps. Chunks don't overlap and a cut is
+    never made outside a pause: when there is none near a chunk boundary the
+    chunk grows to the next one, so no word is split or decoded twice. The
+    language is detected by a pool worker on the first chunk. The model is the
+    one of the Transcriber that calls transcribe, so output names always match it.
+    """
+
+    def __init__(self, num_workers=None, chunk_seconds=300, vad=None):
+        self.num_workers = num_workers or os.cpu_count()
+        self.chunk_seconds = chunk_seconds
+        # short pauses are enough to cut at, a sentence rarely runs for minutes
+        self.vad = vad or VoiceActivityDetector(min_silence_seconds=0.5, padding_seconds=0.1)
+        self.executor = None
+        self.model_name = None
+
+    def get_executor(self, model_name):
+        if self.executor is not None and self.model_name != model_name:
+            self.close()
+        if self.executor is None:
+            threads = max(os.cpu_count() // self.num_workers, 1)
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=CONTEXT,
+                initializer=init_worker,
+                initargs=(model_name, threads),
+            )
+            self.model_name = model_name
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.model_name = None
+
+    def get_cut_points(self, audio):
+        """
+        Pick chunk boundaries in the middle of the pause closest to every chunk_seconds,
+        or of the first pause after it when there is none within half a chunk.
+        """
+        chunk_size = self.chunk_seconds * SAMPLE_RATE
+        regions = self.vad.get_speech_regions(audio)
+        silences = [
+            (end + next_start) // 2
+            for (_, end), (next_start, _) in zip(regions, regions[1:])
+        ]
+
+        cuts = []
+        last = 0
+        while len(audio) - last > 1.5 * chunk_size:
+            target = last + chunk_size
+            candidates = [
+                s for s in silences if last + chunk_size / 2 < s < last + 1.5 * chunk_size
+            ]
+            if not candidates:
+                candidates = [s for s in silences if s >= last + 1.5 * chunk_size][:1]
+            if not candidates:
+                break
+            cut = min(candidates, key=lambda s: abs(s - target))
+            cuts.append(cut)
+            last = cut
+        return cuts
+
+    def detect_language(self, audio, model_name):
+        """Detect the spoken language of the first chunk in a pool worker."""
+        return self.get_executor(model_name).submit(detect_chunk_language, audio).result()
+
+    def transcribe(self, audio, model_name, **options):
+        bounds = [0] + self.get_cut_points(audio) + [len(audio)]
+        chunks = list(zip(bounds, bounds[1:]))
+        logging.info(
+            f"Transcribing {len(audio) / SAMPLE_RATE / 60:.1f} minutes in {len(chunks)} chunks on {self.num_workers} workers"
+        )
+        executor = self.get_executor(model_name)
+        futures = [
+            executor.submit(transcribe_chunk, audio[start:end], options)
+            for start, end in chunks
+        ]
+        results = [future.result() for future in futures]
+        return self.stitch(results, [start / SAMPLE_RATE for start, _ in chunks])
+
+    def stitch(self, results, offsets):
+        merged = {"text": "", "segments": [], "language": results[0].get("language")}
+        for result, offset in zip(results, offsets):
+            for segment in map(dict, result["segments"]):
+                if not segment["text"].strip():
+                    continue
+                segment["id"] = len(merged["segments"])
+                segment["start"] += offset
+                segment["end"] += offset
+                merged["segments"].append(segment)
+        merged["text"] = "".join(segment["text"] for segment in merged["segments"])
+        return merged
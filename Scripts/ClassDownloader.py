@@ -2,107 +2,92 @@ import logging
 import os
 from pathlib import Path
 
-import cv2
-import requests
-from constants import BYTES_TO_GB
-from Transcriber import Transcriber
+from Catalog import Catalog, split_video_stem
+from DiskBudget import DiskBudget
+from DownloadEngine import DownloadEngine
+from Telemetry import span
+from VideoValidator import VideoValidator
 
 
 class ClassDownloader:
     def __init__(
-        self, transcriber: Transcriber, validation_log_file : str = "../DB/validation_test_pass.txt"
+        self,
+        transcriber,
+        catalog: Catalog = None,
+        download_engine: DownloadEngine = None,
+        stream_transcriber=None,
+        disk_budget: DiskBudget = None,
+        deduplicator=None,
     ):
         self.transcriber = transcriber
-        self.validation_log_file = Path(validation_log_file)
-        self.validation_log_path = Path(self.validation_log_file)
+        self.stream_transcriber = stream_transcriber
+        self.disk_budget = disk_budget
+        self.deduplicator = deduplicator
+        self.download_engine = download_engine or DownloadEngine()
+        self.catalog = catalog or Catalog()
+        self.validator = VideoValidator(self.catalog)
 
-    def load_validation_log(self):
-        """Load the validation log file into a set for quick lookup."""
-        if self.validation_log_path.exists():
-            with open(self.validation_log_path, "r", encoding="utf-8") as f:
-                return set(line.strip() for line in f)
-        return set()
+    def has_passed_validation(self, video_path):
+        """Check the catalog for a previous validation pass of the video."""
+        return self.catalog.is_validated(*split_video_stem(Path(video_path).stem))
 
     def log_validation_pass(self, video_path):
-        """Log the video path in the validation log file."""
-        with open(self.validation_log_path, "a", encoding="utf-8") as f:
-            f.write(f"{video_path}\n")
+        """Record the validation pass of the video in the catalog."""
+        self.catalog.set_validated(*split_video_stem(Path(video_path).stem))
+
+    def get_labels(self, video_path):
+        course, number = split_video_stem(Path(video_path).stem)
+        return {"course": course, "number": number}
 
     def validate_video_file(self, video_path, expected_size: int):
-        """Validate that a previously downloaded file matches the expected size and is playable."""
-        actual_size = Path(video_path).stat().st_size
-        if actual_size != expected_size:
-            logging.info(
-                f"File {video_path} size mismatch: expected {expected_size / BYTES_TO_GB:.2f} GB, got {actual_size / BYTES_TO_GB:.2f} GB"
-            )
-            return False
-        if not self.is_download_complete(video_path):
-            logging.info(f"File {video_path} is not playable.")
-            return False
-        return True
+        """Validate that a previously downloaded file matches the expected size and is complete."""
+        with span("validation", **self.get_labels(video_path)) as fields:
+            fields["valid"] = self.validator.validate(video_path, expected_size)
+        return fields["valid"]
 
     def download_video(self, url, path, expected_size):
         """Download or resume a video from a URL and save it to a specified path."""
-        path = Path(path)
-        try:
-            headers = {}
-            existing_file_size = 0
-
-            if path.exists():
-                existing_file_size = path.stat().st_size
-                if existing_file_size > 0:
-                    if existing_file_size < expected_size:
-                        headers = {"Range": f"bytes={existing_file_size}-"}
-                        logging.info(
-                            f"Resuming download for {path} at byte {existing_file_size}"
-                        )
-                    else:
-                        logging.info(
-                            f"Existing file size {existing_file_size / BYTES_TO_GB:.2f} GB is greater than or equal to expected {expected_size / BYTES_TO_GB:.2f} GB. Redownloading..."
-                        )
-                        path.unlink()
-
-            response = requests.get(url, stream=True, headers=headers)
-            if response.status_code in [200, 206]:
-                with open(path, "ab" if existing_file_size > 0 else "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                actual_size = path.stat().st_size
-                return actual_size
-            else:
-                logging.info(
-                    f"Failed to download {url}. Status code: {response.status_code}"
-                )
-                return 0
-        except requests.RequestException as e:
-            logging.info(f"Failed to download {url}: {str(e)}")
-            return 0
+        with span("download", **self.get_labels(path)) as fields:
+            fields["bytes"] = self.download_engine.download(url, path, expected_size)
+        return fields["bytes"]
 
     def is_download_complete(self, file_path):
-        """Check if the downloaded file is complete and playable."""
-        try:
-            cap = cv2.VideoCapture(file_path)
-            if not cap.isOpened():
-                return False
-            ret, _ = cap.read()
-            cap.release()
-            return ret
-        except Exception as e:
-            logging.info(
-                f"Error checking playability of {file_path}: {str(e)}"
-            )
-            return False
+        """Check the mp4 container of a fresh download."""
+        with span("validation", **self.get_labels(file_path)) as fields:
+            fields["valid"] = self.validator.validate(file_path)
+        return fields["valid"]
+
+    def admit(self, scheduler, video_path, expected_size, download=True):
+        if scheduler is None:
+            return True
+        course, number = split_video_stem(Path(video_path).stem)
+        return scheduler.admit(course, number, expected_size, download)
+
+    def transcribe(self, video_path, course_name):
+        if self.disk_budget is not None:
+            self.disk_budget.add_transcribing(video_path)
+        self.transcriber.transcribe_video(video_path, course_name)
 
     # TODO: no me gusta el nombre process. transcribe o algo asi tendria mas sentido 
-    def process_class(self, video_url, video_path, expected_size, course_name):
-        validation_log = self.load_validation_log()
+    def process_class(self, video_url, video_path, expected_size, course_name, scheduler=None):
+        """Returns False if the scheduler didn't admit the class, so it is left for the next run."""
+        # Videos evicted from the disk budget were already transcribed by every model
+        if (
+            self.disk_budget is not None
+            and not video_path.exists()
+            and self.disk_budget.is_transcribed(video_path)
+        ):
+            logging.info(f"Skipping {video_path}, already transcribed by every model.")
+            return
 
         # Check if this video has already passed validation
-        if str(video_path) in validation_log:
+        if video_path.exists() and self.has_passed_validation(video_path):
             logging.info(
                 f"Skipping validation for {video_path}, already passed previously."
             )
-            self.transcriber.transcribe_video(video_path, course_name)
+            if not self.admit(scheduler, video_path, expected_size, download=False):
+                return False
+            self.transcribe(video_path, course_name)
             return
 
         # If the video exists, validate it
@@ -111,20 +96,55 @@ class ClassDownloader:
                 logging.info(
                     f"File {video_path} failed validation, redownloading."
                 )
-                os.remove(video_path)
+                if self.disk_budget is not None:
+                    self.disk_budget.remove(video_path)
+                else:
+                    os.remove(video_path)
             else:
                 logging.info(f"File {video_path} passed validation checks.")
                 self.log_validation_pass(video_path)
-                self.transcriber.transcribe_video(video_path, course_name)
+                if not self.admit(scheduler, video_path, expected_size, download=False):
+                    return False
+                self.transcribe(video_path, course_name)
                 return
 
-        # Download the video if it hasn't been validated
-        actual_size = self.download_video(video_url, video_path, expected_size)
-        if actual_size > 0:
-            if not self.is_download_complete(video_path):
-                logging.info(
-                    f"File {video_path} is not playable, skipping transcription."
-                )
+        # The same lecture may already be transcribed under another course acronym
+        if self.deduplicator is not None and self.deduplicator.reuse_transcripts(
+            video_url, video_path, expected_size
+        ):
+            return
+
+        # In streaming mode the video is transcribed as it downloads and never saved
+        admitted = False
+        if self.stream_transcriber is not None:
+            if not self.admit(scheduler, video_path, expected_size):
+                return False
+            admitted = True
+            if self.stream_transcriber.transcribe_url(video_url, video_path, course_name):
                 return
+            logging.info(
+                f"Streaming failed for {video_url}, falling back to a full download."
+            )
+
+        # Download the video if it hasn't been validated
+        if self.disk_budget is not None and not self.disk_budget.reserve(video_path, expected_size):
+            if admitted and scheduler is not None:
+                scheduler.cancel(expected_size)
+            return
+        try:
+            if not admitted and not self.admit(scheduler, video_path, expected_size):
+                return False
+            actual_size = self.download_video(video_url, video_path, expected_size)
+        finally:
+            if self.disk_budget is not None:
+                self.disk_budget.settle(video_path)
+        if actual_size > 0 and self.is_download_complete(video_path):
             self.log_validation_pass(video_path)
-            self.transcriber.transcribe_video(video_path, course_name)
+            self.transcribe(video_path, course_name)
+            return
+        if actual_size > 0:
+            logging.info(
+                f"File {video_path} is not complete, skipping transcription."
+            )
+        if scheduler is not None:
+            scheduler.cancel(expected_size)
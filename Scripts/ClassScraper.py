@@ -1,69 +1,126 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from pathlib import Path
 
 import requests
 from bs4 import BeautifulSoup
+from Catalog import Catalog
+from Telemetry import span
 
 
 class ClassScraper:
-    def __init__(self, db_path="../DB/Opens/"):
-        self.db_path = Path(db_path)
-        self.timestamp_path = Path(db_path) / "last_run_timestamp.txt"
+    """
+    Scrape the class list of each course, incrementally. Every course page has its
+    own freshness in the catalog and is re-fetched with If-None-Match /
+    If-Modified-Since, so unchanged pages cost a 304 with no body. Only the class
+    numbers that weren't catalogued before are returned.
+    """
 
-    def get_classes_for_course(self, course_acronym):
-        url = f"https://open.fing.edu.uy/courses/{course_acronym}/"
-        response = requests.get(url)
+    def __init__(
+        self,
+        url="https://open.fing.edu.uy/courses/{course}/",
+        catalog=None,
+        refresh_interval=timedelta(weeks=1),
+        max_workers=8,
+    ):
+        self.url = url
+        self.catalog = catalog or Catalog()
+        self.refresh_interval = refresh_interval
+        self.max_workers = max_workers
+        self.session = requests.Session()
+
+    def parse_classes(self, content):
+        # TODO:
+        # scrapear para sacar las clases no es la mejor idea, si cambian la interfaz de la pagina se rompe todo
+        # lo mejor seria hablar con los de open fing. capaz tienen una api o generann los links con un metodo especifico.
         class_numbers = []
+        soup = BeautifulSoup(content, "html.parser")
+        class_list_div = soup.find("div", class_="class-list")
+
+        if class_list_div:
+            classes = class_list_div.find_all("a", class_="class-list__item")
+            for class_item in classes:
+                href = class_item.get("href")
+                if href:
+                    class_number = href.split("/")[-2]
+                    class_numbers.append(class_number)
+        return class_numbers
+
+    def get_classes_for_course(self, course_acronym):
+        """Return the class numbers on the course page, or None if it hasn't changed."""
+        etag, last_modified, _ = self.catalog.get_course_freshness(course_acronym)
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
 
-        if response.status_code == 200:
-            # TODO:
-            # scrapear para sacar las clases no es la mejor idea, si cambian la interfaz de la pagina se rompe todo
-            # lo mejor seria hablar con los de open fing. capaz tienen una api o generann los links con un metodo especifico.
-            soup = BeautifulSoup(response.content, "html.parser")
-            class_list_div = soup.find("div", class_="class-list")
-
-            if class_list_div:
-                classes = class_list_div.find_all("a", class_="class-list__item")
-                for class_item in classes:
-                    href = class_item.get("href")
-                    if href:
-                        class_number = href.split("/")[-2]
-                        class_numbers.append(class_number)
-        else:
+        with span("scrape_classes", course=course_acronym) as fields:
+            response = self.session.get(
+                self.url.format(course=course_acronym), headers=headers, timeout=60
+            )
+            fields["http_status"] = response.status_code
+
+        if response.status_code == 304:
+            self.catalog.set_course_freshness(course_acronym)
+            return None
+        if response.status_code != 200:
             logging.info(
                 f"Failed to retrieve the page for {course_acronym}. Status code: {response.status_code}"
             )
+            return None
 
+        class_numbers = self.parse_classes(response.content)
+        self.catalog.set_course_freshness(
+            course_acronym,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
         return class_numbers
 
-    def save_classes_to_file(self, course_acronym):
-        if self.should_run():
-            classes = self.get_classes_for_course(course_acronym)
-            output_dir = Path(self.db_path) / course_acronym
-            output_dir.mkdir(parents=True, exist_ok=True)
-            output_file = output_dir / "classes.txt"
+    def is_stale(self, course_acronym):
+        _, _, last_scraped = self.catalog.get_course_freshness(course_acronym)
+        if last_scraped is None:
+            return True
+        return datetime.now() - datetime.fromisoformat(last_scraped) > self.refresh_interval
 
-            with open(output_file, "w", encoding="utf-8") as class_file:
-                for class_number in classes:
-                    class_file.write(f"{class_number}\n")
+    def save_classes(self, course_acronym):
+        """Scrape a course if it is stale and return its newly published class numbers."""
+        if not self.is_stale(course_acronym):
+            return []
 
+        classes = self.get_classes_for_course(course_acronym)
+        if classes is None:
+            return []
+
+        new_classes = self.catalog.set_classes(
+            course_acronym, [c for c in classes if c.isdigit()]
+        )
+        if new_classes:
             logging.info(
-                f"Class numbers for course {course_acronym} have been written to {output_file}"
-            )
-            self.update_timestamp()
-        else:
-            logging.info(
-                "ClassScraper skipped as it was already run within the last week."
+                f"Course {course_acronym} has {len(new_classes)} new classes: {', '.join(new_classes)}"
             )
+        return new_classes
 
-    def should_run(self):
-        if self.timestamp_path.exists():
-            with open(self.timestamp_path, "r", encoding="utf-8") as f:
-                last_run = datetime.fromisoformat(f.read().strip())
-                return datetime.now() - last_run > timedelta(weeks=1)
-        return True
+    def save_all_classes(self, course_acronyms):
+        """Scrape every stale course concurrently. Returns {acronym: new class numbers}."""
+        new_classes = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.save_classes, acronym): acronym
+                for acronym in course_acronyms
+            }
+            for future in as_completed(futures):
+                acronym = futures[future]
+                try:
+                    classes = future.result()
+                except requests.RequestException as e:
+                    logging.info(f"Failed to scrape classes for {acronym}: {str(e)}")
+                    continue
+                if classes:
+                    new_classes[acronym] = classes
 
-    def update_timestamp(self):
-        with open(self.timestamp_path, "w", encoding="utf-8") as f:
-            f.write(datetime.now().isoformat())
+        logging.info(
+            f"Class scraping found {sum(len(c) for c in new_classes.values())} new classes in {len(new_classes)} courses"
+        )
+        return new_classes
@@ -2,64 +2,100 @@ import logging
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-import requests
+from Catalog import Catalog
 from ClassDownloader import ClassDownloader
 from constants import BYTES_TO_GB
+from DiskBudget import DiskBudget
+from DownloadEngine import DownloadEngine
+from Telemetry import span
 
 
 class CourseDownloader:
-    def __init__(self, transcriber, base_url="https://open.fing.edu.uy/media/{course}/{course}_{nn}.mp4", db_path="../DB/Opens/", total_max_size=15 * BYTES_TO_GB):
+    def __init__(self, transcriber, base_url="https://open.fing.edu.uy/media/{course}/{course}_{nn}.mp4", db_path="../DB/Opens/", total_max_size=15 * BYTES_TO_GB, max_workers=1, stream_transcriber=None, catalog=None, disk_budget=None, deduplicator=None):
         self.base_url = base_url
         self.transcriber = transcriber
         self.db_path = db_path
-        self.total_max_size = total_max_size
-        self.class_downloader = ClassDownloader(transcriber)
-
-    def get_folder_size(self, path):
-        return path.stat().st_size
+        self.max_workers = max_workers
+        self.download_engine = DownloadEngine()
+        self.catalog = catalog or Catalog()
+        self.disk_budget = disk_budget or DiskBudget(
+            total_max_size, db_path, catalog=self.catalog
+        )
+        self.class_downloader = ClassDownloader(
+            transcriber,
+            catalog=self.catalog,
+            download_engine=self.download_engine,
+            stream_transcriber=stream_transcriber,
+            disk_budget=self.disk_budget,
+            deduplicator=deduplicator,
+        )
 
     def process_course(self, course_name):
-        total_downloaded = 0
-        course_path = Path(self.db_path) / course_name
-        course_path.mkdir(exist_ok=True)
-        classes_file_path = course_path / "classes.txt"
+        class_numbers = self.catalog.get_class_numbers(course_name)
 
-        if not classes_file_path.exists():
-            logging.info(f"No classes.txt found for {course_name}, skipping...")
+        if not class_numbers:
+            logging.info(f"No classes found in the catalog for {course_name}, skipping...")
             return
+        self.process_classes(course_name, class_numbers)
 
-        with open(classes_file_path, "r") as file:
-            class_numbers = [line.strip() for line in file if line.strip().isdigit()]
+    def process_classes(self, course_name, class_numbers, claims=None, scheduler=None):
+        """Process the given classes of a course. With claims, only the classes this shard claims."""
+        self.process_jobs([(course_name, nn) for nn in class_numbers], claims, scheduler)
 
-        folder_size = self.get_folder_size(course_path)
+    def process_jobs(self, jobs, claims=None, scheduler=None):
+        """
+        Process (course, number) classes, possibly from several courses. With a
+        scheduler they are reordered by its policy and each one is only started if
+        the scheduler admits it when a download slot frees up.
+        """
         file_count = 0
 
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            futures = []
-            for nn in class_numbers:
-                formatted_nn = nn.zfill(2)
-                video_path = course_path / f"{course_name}_{formatted_nn}.mp4"
-                video_url = self.base_url.format(course=course_name, nn=formatted_nn)
-
-                # Initialize expected_size to a default value
-                expected_size = 0
-                try:
-                    response = requests.head(video_url)
-                    expected_size = int(response.headers.get('content-length', 0))
-                except Exception as e:
-                    logging.info(f"Failed to get expected size for {video_url}: {str(e)}")
-                    continue  # Skip this video if we can't determine the expected size
+        video_urls = {
+            (course_name, nn.zfill(2)): self.base_url.format(course=course_name, nn=nn.zfill(2))
+            for course_name, nn in jobs
+        }
+        for course_name in dict.fromkeys(course for course, _ in video_urls):
+            (Path(self.db_path) / course_name).mkdir(parents=True, exist_ok=True)
+        with span("head", files=len(video_urls)):
+            expected_sizes = self.download_engine.head_many(video_urls.values())
+        sizes_by_course = {}
+        for (course_name, nn), url in video_urls.items():
+            if expected_sizes.get(url) is not None:
+                sizes_by_course.setdefault(course_name, {})[nn] = (url, expected_sizes[url])
+        for course_name, sizes in sizes_by_course.items():
+            self.catalog.set_expected_sizes(course_name, sizes)
 
-                if total_downloaded >= self.total_max_size:
-                    break
+        # Skip the videos whose expected size can't be determined
+        entries = [
+            (course_name, nn, url, expected_sizes[url])
+            for (course_name, nn), url in video_urls.items()
+            if expected_sizes.get(url) is not None
+        ]
+        if scheduler is not None:
+            entries = scheduler.order(entries)
 
-                futures.append(executor.submit(self.class_downloader.process_class, video_url, video_path, expected_size, course_name))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for course_name, formatted_nn, video_url, expected_size in entries:
+                video_path = Path(self.db_path) / course_name / f"{course_name}_{formatted_nn}.mp4"
+                futures[executor.submit(self.process_claimed_class, claims, scheduler, video_url, video_path, expected_size, course_name)] = video_path
 
             for future in as_completed(futures):
-                future.result()
-                file_count += 1
-                total_downloaded = self.get_folder_size(course_path)  # Recalculate total size
-                if total_downloaded >= self.total_max_size:
-                    break
+                try:
+                    if future.result() is not False:
+                        file_count += 1
+                except Exception as e:
+                    logging.info(f"Error processing {futures[future]}: {str(e)}")
+
+        logging.info(f"Courses: {len(sizes_by_course)}, Files: {file_count}, Disk budget used: {self.disk_budget.get_used() / BYTES_TO_GB:.2f} GB")
 
-        logging.info(f"Course: {course_name}, Files: {file_count}, Directory size: {folder_size / BYTES_TO_GB:.2f} GB")
+    def process_claimed_class(self, claims, scheduler, video_url, video_path, expected_size, course_name):
+        # claims are held until the end of the run, the transcription of the class is still queued
+        if claims is not None and not claims.claim(video_path.stem):
+            logging.info(f"{video_path.stem} is claimed by another shard, skipping...")
+            return False
+        # the scheduler is only asked once the class turns out to need a download or a transcription
+        if self.class_downloader.process_class(video_url, video_path, expected_size, course_name, scheduler) is False:
+            if claims is not None:
+                claims.release(video_path.stem)
+            return False
@@ -1,24 +1,25 @@
 import logging
-from datetime import datetime, timedelta
-from pathlib import Path
 
 import requests
 from bs4 import BeautifulSoup
+from Catalog import Catalog
+from Telemetry import span
 
 
 class CourseScraper:
     def __init__(
         self,
         url="https://open.fing.edu.uy/courses/",
-        db_path="../DB/CoursesNames/",
+        catalog=None,
     ):
         self.url = url
-        self.db_path = db_path
-        self.timestamp_path = Path(db_path) / "last_run_timestamp.txt"
+        self.catalog = catalog or Catalog()
 
     def fetch_courses(self):
         if self.should_run():
-            response = requests.get(self.url)
+            with span("scrape_courses") as fields:
+                response = requests.get(self.url)
+                fields["http_status"] = response.status_code
             if response.status_code == 200:
                 soup = BeautifulSoup(response.content, "html.parser")
                 course_list_div = soup.find("div", class_="course-list")
@@ -37,10 +38,9 @@ class CourseScraper:
                         if course_title_span:
                             course_names.append(course_title_span.text.strip())
 
-                self.write_to_file(course_acronyms, "course_acronyms.txt")
-                self.write_to_file(course_names, "course_names.txt")
+                self.catalog.set_courses(course_acronyms, course_names)
                 logging.info(
-                    "Course acronyms and names have been written to 'course_acronyms.txt' and 'course_names.txt'."
+                    f"{len(course_acronyms)} course acronyms and names have been saved to the catalog."
                 )
                 self.update_timestamp()
             else:
@@ -52,20 +52,8 @@ class CourseScraper:
                 "CourseScraper skipped as it was already run within the last week."
             )
 
-    def write_to_file(self, data, filename):
-        file_path = Path(self.db_path) / filename
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(file_path, "w", encoding="utf-8") as file:
-            for item in data:
-                file.write(f"{item}\n")
-
     def should_run(self):
-        if self.timestamp_path.exists():
-            with open(self.timestamp_path, "r", encoding="utf-8") as f:
-                last_run = datetime.fromisoformat(f.read().strip())
-                return datetime.now() - last_run > timedelta(weeks=1)
-        return True
+        return self.catalog.should_run("course_scraper")
 
     def update_timestamp(self):
-        with open(self.timestamp_path, "w", encoding="utf-8") as f:
-            f.write(datetime.now().isoformat())
+        self.catalog.update_timestamp("course_scraper")
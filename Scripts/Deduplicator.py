@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import requests
+from Catalog import Catalog, split_video_stem
+from constants import BYTES_TO_GB
+from DownloadEngine import BYTES_TO_MB, DownloadEngine
+from Telemetry import span
+
+
+def compute_fingerprint(size, head, tail):
+    hasher = hashlib.sha256(f"{size}:".encode())
+    hasher.update(head)
+    hasher.update(tail)
+    return hasher.hexdigest()
+
+
+class Deduplicator:
+    """
+    Recognise lectures that were already transcribed under another course acronym
+    (cdi / cdivv-2022, redes-2021 / redes2, ...) before downloading them. A video
+    is fingerprinted by its size and a hash of its first and last sample_size
+    bytes, fetched with two Range requests. Only classes with the same HEAD size
+    are compared, and their fingerprints are computed on demand (from the local
+    file when it is still on disk) and kept in the catalog. When a transcribed
+    twin is found its transcripts are hard linked, or copied, instead of
+    downloading and transcribing the video again, and indexed for search.
+    Transcribed classes whose size was never HEADed (those imported from the
+    legacy files) get it from backfill_sizes, so they can be a source too.
+    """
+
+    def __init__(
+        self,
+        catalog: Catalog = None,
+        download_engine: DownloadEngine = None,
+        model_names=("medium",),
+        db_path="../DB/Opens/",
+        transcription_path="../DB/Transcripciones/",
+        sample_size=4 * BYTES_TO_MB,
+        search_index=None,
+        base_url="https://open.fing.edu.uy/media/{course}/{course}_{nn}.mp4",
+    ):
+        self.catalog = catalog or Catalog()
+        self.base_url = base_url
+        self.search_index = search_index
+        self.download_engine = download_engine or DownloadEngine()
+        self.model_names = set(model_names)
+        self.db_path = Path(db_path)
+        self.transcription_path = Path(transcription_path)
+        self.sample_size = sample_size
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.transcripts_linked = 0
+        self.bytes_saved = 0
+
+    def get_fingerprint(self, course, number, url, size):
+        fingerprint = self.catalog.get_fingerprint(course, number, size)
+        if fingerprint is not None:
+            return fingerprint
+
+        tail_start = max(size - self.sample_size, self.sample_size)
+        video_path = self.db_path / course / f"{course}_{number}.mp4"
+        if video_path.exists() and video_path.stat().st_size == size:
+            with open(video_path, "rb") as f:
+                head = f.read(self.sample_size)
+                f.seek(tail_start)
+                tail = f.read()
+        elif url:
+            head = self.download_engine.get_bytes(url, 0, min(self.sample_size, size) - 1)
+            tail = b""
+            if tail_start < size:
+                tail = self.download_engine.get_bytes(url, tail_start, size - 1)
+        else:
+            return None
+
+        fingerprint = compute_fingerprint(size, head, tail)
+        self.catalog.set_fingerprint(course, number, size, fingerprint)
+        return fingerprint
+
+    def backfill_sizes(self):
+        """HEAD the transcribed classes with no expected size and store it in the catalog."""
+        classes = self.catalog.get_unsized_transcribed_classes(list(self.model_names))
+        if not classes:
+            return
+        video_urls = {
+            (course, number): url or self.base_url.format(course=course, nn=number)
+            for course, number, url in classes
+        }
+        with span("head", files=len(video_urls)):
+            expected_sizes = self.download_engine.head_many(video_urls.values())
+        sizes_by_course = {}
+        for (course, number), url in video_urls.items():
+            if expected_sizes.get(url) is not None:
+                sizes_by_course.setdefault(course, {})[number] = (url, expected_sizes[url])
+        for course, sizes in sizes_by_course.items():
+            self.catalog.set_expected_sizes(course, sizes)
+        logging.info(
+            f"Backfilled the size of {sum(map(len, sizes_by_course.values()))} of "
+            f"{len(video_urls)} transcribed classes for deduplication"
+        )
+
+    def is_transcribed(self, course, number):
+        return all(
+            self.model_names <= self.catalog.get_transcribed_models(course, number, language)
+            for language in ["es", "ad"]
+        )
+
+    def find_source(self, course, number, url, size):
+        """Return (course, number) of an already transcribed class with the same content, if any."""
+        candidates = [
+            (other_course, other_number, other_url)
+            for other_course, other_number, other_url in self.catalog.get_classes_with_size(size)
+            if (other_course, other_number) != (course, number)
+            and self.is_transcribed(other_course, other_number)
+        ]
+        if not candidates:
+            return None
+        fingerprint = self.get_fingerprint(course, number, url, size)
+        for other_course, other_number, other_url in candidates:
+            if self.get_fingerprint(other_course, other_number, other_url, size) == fingerprint:
+                return other_course, other_number
+        return None
+
+    def link_transcripts(self, source, course, number):
+        linked = 0
+        for model, language, source_path in self.catalog.get_transcriptions(*source):
+            if model not in self.model_names:
+                continue
+            source_path = Path(source_path)
+            if not source_path.exists():
+                continue
+            target_path = (
+                self.transcription_path
+                / language
+                / course
+                / f"{course}_{number}_{model}{source_path.suffix}"
+            )
+            if not target_path.exists():
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(source_path, target_path)
+                except OSError:
+                    shutil.copy2(source_path, target_path)
+            self.catalog.record_transcription(target_path)
+            if self.search_index is not None:
+                self.search_index.add_transcript(target_path)
+            linked += 1
+        return linked
+
+    def reuse_transcripts(self, video_url, video_path, expected_size):
+        """
+        If the video at video_url was already transcribed under another course, link
+        its transcripts to this class and return True, so the download is skipped.
+        """
+        course, number = split_video_stem(video_path.stem)
+        with span("dedup", course=course, number=number) as fields:
+            try:
+                source = self.find_source(course, number, video_url, expected_size)
+            except (requests.RequestException, OSError) as e:
+                logging.info(f"Failed to fingerprint {video_url}: {str(e)}")
+                return False
+            fields["duplicate"] = source is not None
+            if source is None:
+                return False
+            linked = self.link_transcripts(source, course, number)
+            # transcripts missing on disk are left to the normal download path
+            if not self.is_transcribed(course, number):
+                return False
+
+        logging.info(
+            f"{video_path.stem} is the same video as {source[0]}_{source[1]}, "
+            f"reused {linked} transcripts instead of downloading {expected_size / BYTES_TO_GB:.2f} GB"
+        )
+        with self.lock:
+            self.duplicates += 1
+            self.transcripts_linked += linked
+            self.bytes_saved += expected_size
+        return True
+
+    def report(self):
+        logging.info(
+            f"Deduplication: {self.duplicates} duplicate classes, {self.transcripts_linked} transcripts reused, "
+            f"{self.bytes_saved / BYTES_TO_GB:.2f} GB not downloaded"
+        )
@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from pathlib import Path
+
+from Catalog import Catalog, split_video_stem
+from constants import BYTES_TO_GB
+
+# how often a reservation waiting for space checks the catalog for finished transcriptions
+WAIT_SECONDS = 30
+# video and streamed audio files that eviction may delete
+EVICTABLE_SUFFIXES = (".mp4", ".m4a")
+# a shared reservation whose download hasn't written anything for this long was left by a killed job
+STALE_RESERVATION_SECONDS = 10 * 60
+
+
+class DiskBudget:
+    """
+    Byte budget for the videos under db_path, shared by every course and download
+    thread. The directory is scanned once at startup, after that usage is tracked
+    incrementally: downloads reserve their expected size up front and settle to
+    the real size when they finish. When a reservation doesn't fit, videos whose
+    transcriptions exist for every model in model_names are deleted, least
+    recently used first, and then audio_cache entries, which count against the
+    budget too. If that isn't enough the reservation waits, up to max_wait
+    seconds, for the videos being downloaded or transcribed to be done, and a
+    video is always admitted when nothing else is on disk or reserved, however
+    large it is.
+
+    With shared, several shards download into the same db_path: every
+    reservation is also written as a <video>.reserved file holding the expected
+    size, and the directory is scanned again before each reservation, so the
+    budget covers the files and reservations of every shard.
+    """
+
+    def __init__(
+        self,
+        max_size=15 * BYTES_TO_GB,
+        db_path="../DB/Opens/",
+        model_names=("medium",),
+        catalog: Catalog = None,
+        audio_cache=None,
+        max_wait=2 * 60 * 60,
+        shared=False,
+    ):
+        self.max_size = max_size
+        self.db_path = Path(db_path)
+        self.model_names = set(model_names)
+        self.catalog = catalog or Catalog()
+        self.audio_cache = audio_cache
+        self.max_wait = max_wait
+        self.shared = shared
+        self.lock = threading.Lock()
+        # signalled when reserved or evictable bytes may have been released
+        self.released = threading.Condition(self.lock)
+        self.reservations = {}
+        # video path -> bytes still missing, reserved by the other shards
+        self.shared_reservations = {}
+        self.sizes = {}
+        self.last_used = {}
+        # videos handed to transcription in this run, they become evictable once transcribed
+        self.transcribing = set()
+        self.used = 0
+        self.scan()
+        logging.info(
+            f"Disk budget: {self.get_used() / BYTES_TO_GB:.2f} GB used of {self.max_size / BYTES_TO_GB:.2f} GB"
+        )
+
+    def get_reservation_path(self, video_path):
+        return Path(str(video_path) + ".reserved")
+
+    def scan(self):
+        """Measure every file under db_path, and the shared reservations. Lock must be held."""
+        self.sizes = {}
+        self.shared_reservations = {}
+        now = time.time()
+        reserved = {}
+        for path in self.db_path.rglob("*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if not path.is_file():
+                continue
+            if path.suffix == ".reserved":
+                reserved[str(path)[: -len(".reserved")]] = (path, stat.st_mtime)
+                continue
+            self.sizes[str(path)] = stat.st_size
+            self.last_used[str(path)] = max(self.last_used.get(str(path), 0), stat.st_mtime)
+        self.used = sum(self.sizes.values())
+        for video_path, (reservation_path, mtime) in reserved.items():
+            files = [video_path, video_path + ".part"]
+            last_write = max([mtime] + [self.last_used[f] for f in files if f in self.sizes])
+            ours = video_path in self.reservations
+            if not ours and now - last_write > STALE_RESERVATION_SECONDS:
+                continue
+            try:
+                expected_size = int(reservation_path.read_text())
+            except (FileNotFoundError, ValueError):
+                continue
+            # the bytes already downloaded are counted in sizes
+            missing = max(expected_size - sum(self.sizes.get(f, 0) for f in files), 0)
+            if not ours:
+                self.shared_reservations[video_path] = missing
+            self.used += missing
+
+    def get_used(self):
+        if self.audio_cache is not None:
+            return self.used + self.audio_cache.get_cache_size()
+        return self.used
+
+    def get_file_sizes(self, video_path):
+        """Bytes on disk for a video, including an in-progress ranged download."""
+        video_path = Path(video_path)
+        sizes = {}
+        for path in [video_path, video_path.with_name(video_path.name + ".part")]:
+            if path.exists():
+                sizes[str(path)] = path.stat().st_size
+        return sizes
+
+    def is_transcribed(self, video_path):
+        """True if the video has Spanish and auto-detected transcriptions for every model."""
+        course, number = split_video_stem(Path(video_path).stem)
+        return all(
+            self.model_names <= self.catalog.get_transcribed_models(course, number, language)
+            for language in ["es", "ad"]
+        )
+
+    def add_transcribing(self, video_path):
+        """Track a video queued for transcription, reservations wait for it to become evictable."""
+        with self.lock:
+            self.transcribing.add(str(video_path))
+            self.last_used[str(video_path)] = time.time()
+
+    def is_alone(self, video_path):
+        """True if no other video is on disk or reserved. Lock must be held."""
+        own = {str(video_path), str(video_path) + ".part"}
+        return (
+            not self.reservations
+            and not self.shared_reservations
+            and all(path in own for path in self.sizes)
+        )
+
+    def reserve(self, video_path, expected_size):
+        """
+        Reserve the bytes still missing for video_path, waiting for space to be
+        freed. Returns False if they don't fit and nothing in progress can free them.
+        """
+        on_disk = sum(self.get_file_sizes(video_path).values())
+        needed = max(expected_size - on_disk, 0)
+        waited_since = time.time()
+        with self.lock:
+            while True:
+                if self.shared:
+                    self.scan()
+                if self.get_used() + needed > self.max_size:
+                    self.evict(self.get_used() + needed - self.max_size)
+                if self.get_used() + needed <= self.max_size:
+                    break
+                if self.is_alone(video_path):
+                    logging.info(
+                        f"{video_path} needs {needed / BYTES_TO_GB:.2f} GB, over the disk budget, "
+                        f"downloading it anyway as nothing else is on disk"
+                    )
+                    break
+                self.transcribing = {
+                    path for path in self.transcribing if not self.is_transcribed(path)
+                }
+                if (
+                    not self.reservations and not self.shared_reservations and not self.transcribing
+                ) or time.time() - waited_since > self.max_wait:
+                    logging.info(
+                        f"Not enough disk budget for {video_path}: {needed / BYTES_TO_GB:.2f} GB needed, "
+                        f"{(self.max_size - self.get_used()) / BYTES_TO_GB:.2f} GB available"
+                    )
+                    return False
+                self.released.wait(WAIT_SECONDS)
+            self.reservations[str(video_path)] = needed
+            self.used += needed
+            self.last_used[str(video_path)] = time.time()
+            if self.shared:
+                self.get_reservation_path(video_path).write_text(str(expected_size))
+        return True
+
+    def settle(self, video_path):
+        """Replace the reservation of video_path with the bytes it actually uses."""
+        sizes = self.get_file_sizes(video_path)
+        with self.lock:
+            if self.shared:
+                self.get_reservation_path(video_path).unlink(missing_ok=True)
+            self.used -= self.reservations.pop(str(video_path), 0)
+            for path in [str(video_path), str(video_path) + ".part"]:
+                self.used -= self.sizes.pop(path, 0)
+            self.sizes.update(sizes)
+            self.used += sum(sizes.values())
+            self.released.notify_all()
+
+    def remove(self, video_path):
+        """Delete a video and stop accounting for it."""
+        Path(video_path).unlink(missing_ok=True)
+        with self.lock:
+            self.used -= self.sizes.pop(str(video_path), 0)
+            self.last_used.pop(str(video_path), None)
+            self.released.notify_all()
+
+    def evict(self, required):
+        """
+        Delete fully transcribed videos, least recently used first, and then audio
+        cache entries, to free required bytes. Lock must be held.
+        """
+        candidates = sorted(
+            (
+                path
+                for path in self.sizes
+                if path.endswith(EVICTABLE_SUFFIXES) and path not in self.reservations
+            ),
+            key=lambda path: self.last_used.get(path, 0),
+        )
+        freed = 0
+        for path in candidates:
+            if freed >= required:
+                break
+            if not self.is_transcribed(path):
+                continue
+            size = self.sizes.pop(path)
+            self.used -= size
+            self.last_used.pop(path, None)
+            Path(path).unlink(missing_ok=True)
+            freed += size
+            logging.info(f"Evicted transcribed video {path} ({size / BYTES_TO_GB:.2f} GB)")
+        if freed < required and self.audio_cache is not None:
+            cache_size = self.audio_cache.get_cache_size()
+            freed += self.audio_cache.evict(max(cache_size - (required - freed), 0))
+        return freed
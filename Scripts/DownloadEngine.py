@@ -0,0 +1,272 @@
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import requests
+from constants import BYTES_TO_GB
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BYTES_TO_MB = 1024 * 1024
+
+
+def parse_content_range(header):
+    """Return (start, end) of a 'bytes start-end/total' Content-Range header, or None."""
+    match = re.fullmatch(r"\s*bytes\s+(\d+)-(\d+)/(\d+|\*)\s*", header or "")
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+class DownloadEngine:
+    """
+    Shared HTTP download engine: one pooled session for every request, concurrent
+    HEAD prefetch, and large files split into parallel byte ranges that are
+    written in place into a preallocated .part file. Range progress is kept in a
+    .ranges sidecar so an interrupted download resumes where each range stopped.
+    A server may answer a range with fewer bytes than asked for, so the
+    Content-Range of every 206 is checked and the rest is requested again; the
+    .part file is only renamed once every range is complete.
+    """
+
+    def __init__(
+        self,
+        max_connections=8,
+        range_parts=4,
+        min_range_size=256 * BYTES_TO_MB,
+        chunk_size=BYTES_TO_MB,
+        buffer_size=8 * BYTES_TO_MB,
+        timeout=60,
+    ):
+        self.max_connections = max_connections
+        self.range_parts = range_parts
+        self.min_range_size = min_range_size
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.accepts_ranges = {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_connections,
+            pool_maxsize=max_connections,
+            max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504]),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def head(self, url):
+        """Return the content-length of url, or None if it can't be determined."""
+        response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        if response.status_code != 200:
+            logging.info(f"HEAD {url} returned status code {response.status_code}")
+            return None
+        self.accepts_ranges[url] = (
+            response.headers.get("accept-ranges", "").lower() == "bytes"
+        )
+        return int(response.headers.get("content-length", 0))
+
+    def head_many(self, urls):
+        """Issue HEAD requests for all urls concurrently and return {url: size or None}."""
+        sizes = {}
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            futures = {executor.submit(self.head, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    sizes[url] = future.result()
+                except requests.RequestException as e:
+                    logging.info(f"Failed to get expected size for {url}: {str(e)}")
+                    sizes[url] = None
+        return sizes
+
+    def get_range(self, url, start, end, stream=False):
+        """
+        Request bytes start..end of url and check that the 206 starts at start.
+        The response may still end before end, the caller asks again for the rest.
+        """
+        response = self.session.get(
+            url, stream=stream, headers={"Range": f"bytes={start}-{end}"}, timeout=self.timeout
+        )
+        if response.status_code != 206:
+            response.close()
+            raise requests.RequestException(
+                f"Range request for {url} returned status code {response.status_code}"
+            )
+        content_range = parse_content_range(response.headers.get("content-range"))
+        if content_range is None or content_range[0] != start:
+            response.close()
+            raise requests.RequestException(
+                f"Range request for {url} bytes {start}-{end} returned Content-Range "
+                f"{response.headers.get('content-range')!r}"
+            )
+        return response
+
+    def get_bytes(self, url, start, end):
+        """Fetch bytes start..end (inclusive) of url, with as many Range requests as it takes."""
+        content = bytearray()
+        while start + len(content) <= end:
+            with self.get_range(url, start + len(content), end) as response:
+                received = response.content[: end + 1 - start - len(content)]
+            if not received:
+                raise requests.RequestException(
+                    f"Range request for {url} returned no data at byte {start + len(content)}"
+                )
+            content += received
+        return bytes(content)
+
+    def download(self, url, path, expected_size):
+        """Download or resume url into path. Returns the final file size, or 0 on failure."""
+        path = Path(path)
+        try:
+            if (
+                self.range_parts > 1
+                and expected_size >= self.min_range_size
+                and self.accepts_ranges.get(url, False)
+            ):
+                return self.download_ranges(url, path, expected_size)
+            return self.download_stream(url, path, expected_size)
+        except (requests.RequestException, OSError) as e:
+            logging.info(f"Failed to download {url}: {str(e)}")
+            return 0
+
+    def download_stream(self, url, path, expected_size):
+        """Single connection download that resumes from the end of an existing partial file."""
+        headers = {}
+        existing_file_size = 0
+
+        if path.exists():
+            existing_file_size = path.stat().st_size
+            if existing_file_size > 0:
+                if existing_file_size < expected_size:
+                    headers = {"Range": f"bytes={existing_file_size}-"}
+                    logging.info(
+                        f"Resuming download for {path} at byte {existing_file_size}"
+                    )
+                else:
+                    logging.info(
+                        f"Existing file size {existing_file_size / BYTES_TO_GB:.2f} GB is greater than or equal to expected {expected_size / BYTES_TO_GB:.2f} GB. Redownloading..."
+                    )
+                    path.unlink()
+                    existing_file_size = 0
+
+        with self.session.get(
+            url, stream=True, headers=headers, timeout=self.timeout
+        ) as response:
+            if response.status_code not in [200, 206]:
+                logging.info(
+                    f"Failed to download {url}. Status code: {response.status_code}"
+                )
+                return 0
+            # a 200 means the server ignored the range and is sending the whole file
+            resumed = response.status_code == 206 and existing_file_size > 0
+            if resumed:
+                content_range = parse_content_range(response.headers.get("content-range"))
+                if content_range is None or content_range[0] != existing_file_size:
+                    raise requests.RequestException(
+                        f"Resuming {url} at byte {existing_file_size} returned Content-Range "
+                        f"{response.headers.get('content-range')!r}"
+                    )
+            with open(path, "ab" if resumed else "wb", buffering=self.buffer_size) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+        return path.stat().st_size
+
+    def download_ranges(self, url, path, expected_size):
+        """Download url as range_parts parallel byte ranges written into a preallocated file."""
+        part_path = path.with_name(path.name + ".part")
+        progress_path = path.with_name(path.name + ".ranges")
+
+        ranges = self.load_progress(progress_path, expected_size)
+        if ranges is None or not part_path.exists():
+            ranges = self.split_ranges(expected_size)
+            with open(part_path, "wb") as f:
+                f.truncate(expected_size)
+        else:
+            logging.info(f"Resuming ranged download for {path}")
+
+        lock = threading.Lock()
+        pending = [r for r in ranges if not self.is_complete(r)]
+        with ThreadPoolExecutor(max_workers=self.range_parts) as executor:
+            futures = [
+                executor.submit(
+                    self.fetch_range, url, part_path, r, ranges, progress_path, lock
+                )
+                for r in pending
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+        # the preallocated .part already has the final size, only the ranges tell if it is filled
+        incomplete = [r for r in ranges if not self.is_complete(r)]
+        if incomplete:
+            raise requests.RequestException(
+                f"{len(incomplete)} ranges of {url} are incomplete, keeping {part_path} to resume"
+            )
+
+        part_path.replace(path)
+        progress_path.unlink(missing_ok=True)
+        return path.stat().st_size
+
+    def is_complete(self, byte_range):
+        return byte_range["written"] == byte_range["end"] - byte_range["start"] + 1
+
+    def split_ranges(self, size):
+        part_size = -(-size // self.range_parts)
+        return [
+            {"start": start, "end": min(start + part_size, size) - 1, "written": 0}
+            for start in range(0, size, part_size)
+        ]
+
+    def fetch_range(self, url, part_path, byte_range, ranges, progress_path, lock):
+        end = byte_range["end"]
+        start = byte_range["start"] + byte_range["written"]
+        # a 206 may legally stop short of end, keep asking for the rest until the range is full
+        while start <= end:
+            with self.get_range(url, start, end, stream=True) as response:
+                # each thread owns its handle, so seek + write is a positional write
+                with open(part_path, "r+b", buffering=0) as f:
+                    received = start
+                    buffer = bytearray()
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        buffer += chunk
+                        if len(buffer) >= self.buffer_size:
+                            buffer = buffer[: end + 1 - start]
+                            self.write_at(f, start, buffer, byte_range, ranges, progress_path, lock)
+                            start += len(buffer)
+                            buffer = bytearray()
+                            if start > end:
+                                break
+                    buffer = buffer[: end + 1 - start]
+                    if buffer:
+                        self.write_at(f, start, buffer, byte_range, ranges, progress_path, lock)
+                        start += len(buffer)
+            if start == received:
+                raise requests.RequestException(
+                    f"Range request for {url} returned no data at byte {start}"
+                )
+
+    def write_at(self, f, offset, buffer, byte_range, ranges, progress_path, lock):
+        f.seek(offset)
+        f.write(buffer)
+        with lock:
+            byte_range["written"] += len(buffer)
+            self.save_progress(progress_path, ranges)
+
+    def load_progress(self, progress_path, expected_size):
+        if not progress_path.exists():
+            return None
+        with open(progress_path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress.get("size") != expected_size:
+            return None
+        return progress["ranges"]
+
+    def save_progress(self, progress_path, ranges):
+        tmp_path = progress_path.with_name(progress_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"size": ranges[-1]["end"] + 1, "ranges": ranges}, f)
+        tmp_path.replace(progress_path)
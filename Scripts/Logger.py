@@ -1,3 +1,4 @@
+import atexit
 from pathlib import Path
 from datetime import datetime
 
@@ -6,8 +7,14 @@ class Logger:
         current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.log_file_path = Path(log_dir) / f"log_{current_time}.txt"
         self.log_file_path.parent.mkdir(parents=True, exist_ok=True)
+        # the file stays open for the whole run, line buffered so every message reaches the disk
+        self.log_file = open(self.log_file_path, "a", buffering=1)
+        atexit.register(self.close)
 
     def log_message(self, message):
         """Write a message to the log file."""
-        with open(self.log_file_path, "a") as log_file:
-            log_file.write(message + "\n")
+        self.log_file.write(message + "\n")
+
+    def close(self):
+        if not self.log_file.closed:
+            self.log_file.close()
@@ -1,77 +1,180 @@
+import argparse
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
+import time
+from itertools import zip_longest
 
+from AudioCache import AudioCache
+from Catalog import Catalog
 from ClassScraper import ClassScraper
 from constants import BYTES_TO_GB
 from CourseDownloader import CourseDownloader  # Updated import
 from CourseScraper import CourseScraper
-from tqdm import tqdm
-from Transcriber import Transcriber
+from Deduplicator import Deduplicator
+from DiskBudget import DiskBudget
+from Scheduler import POLICIES, Scheduler
+from SearchIndex import SearchIndex
+from Sharding import ClassClaims, get_assignment, get_shard
+from TranscriptionPipeline import TranscriptionPipeline
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
 
-
-def download_course_videos(acronym, course_downloader: CourseDownloader):
-    course_downloader.process_course(acronym)
+# --time-limit counts from here, scraping and the catalog setup are part of the run
+START_TIME = time.time()
+
+
+MODEL_NAMES = ["medium"]
+# scratch disk for the videos and their decoded audio
+DISK_BUDGET = 2 * BYTES_TO_GB
+
+
+def get_shard_work(shards, pending, shard_index, new_classes):
+    """
+    Return the (course, number) classes this shard should try: its own share of
+    the byte-balanced split, and the other shards' shares from their end, to
+    steal work from the shards that are behind. Classes scraped after the split
+    was made belong to shard 0, which found them, and are stolen last.
+    """
+    shard_count = len(shards)
+    own = sorted(shards[shard_index], key=lambda c: c[0] not in new_classes)
+    others = [
+        list(reversed(shards[(shard_index + offset) % shard_count]))
+        for offset in range(1, shard_count)
+    ]
+    stolen = [c for row in zip_longest(*others) for c in row if c is not None]
+    own = [(course, number) for course, number, _ in own]
+    stolen = [(course, number) for course, number, _ in stolen]
+    assigned = set(own) | set(stolen)
+    unassigned = sorted(
+        (c for c in pending if c not in assigned), key=lambda c: c[0] not in new_classes
+    )
+    if shard_index == 0:
+        own += unassigned
+    else:
+        stolen += unassigned
+    return (
+        [c for c in own if c in pending],
+        [c for c in stolen if c in pending],
+    )
 
 
 def main():
-    course_scraper = CourseScraper()
-    class_scraper = ClassScraper()
-
-    course_acronyms_path = Path("../DB/CoursesNames/course_acronyms.txt")
+    parser = argparse.ArgumentParser(description="Download and transcribe the open.fing lectures")
+    parser.add_argument("--shard-index", type=int, help="defaults to SLURM_ARRAY_TASK_ID")
+    parser.add_argument("--shard-count", type=int, help="defaults to SLURM_ARRAY_TASK_COUNT")
+    parser.add_argument("--policy", choices=POLICIES, default="deadline", help="order of the classes")
+    parser.add_argument("--time-limit", type=float, help="wall-clock minutes available to this run")
+    parser.add_argument(
+        "--checkpoint-seconds",
+        type=float,
+        help="save transcription progress every N seconds of audio so killed jobs resume (off by default)",
+    )
+    args = parser.parse_args()
+    shard_index, shard_count = get_shard(args.shard_index, args.shard_count)
+
+    # con varios nodos el catalogo esta en el filesystem compartido, donde WAL no funciona.
+    # DELETE depende de los locks POSIX de SQLite, que NFS solo respeta si el lock manager
+    # (lockd, o NFSv4) funciona en todos los nodos; sin eso dos escrituras simultaneas pueden
+    # corromper el catalogo. Los claims de Sharding evitan que dos shards procesen la misma clase.
+    journal_mode = "WAL" if shard_count == 1 else "DELETE"
+    catalog = Catalog(journal_mode=journal_mode)
+    if not catalog.get_course_acronyms():
+        catalog.import_legacy()
+
+    # the split is fixed before shard 0 starts scraping, so every shard uses the same one
+    shards = (
+        get_assignment(catalog.get_classes, shard_index, shard_count)
+        if shard_count > 1
+        else None
+    )
+
+    course_acronyms = catalog.get_course_acronyms()
+    new_classes = {}
+    # only the first shard scrapes, the rest work from the catalog as it is
+    if shard_index == 0:
+        course_scraper = CourseScraper(catalog=catalog)
+        class_scraper = ClassScraper(catalog=catalog)
 
-    if course_scraper.should_run() or class_scraper.should_run():
         course_scraper.fetch_courses()
 
-        if course_acronyms_path.exists():
-            with open(course_acronyms_path, "r", encoding="utf-8") as file:
-                course_acronyms = [line.strip() for line in file if line.strip()]
+        course_acronyms = catalog.get_course_acronyms()
+        # each course page is only re-fetched when stale, and conditionally
+        new_classes = class_scraper.save_all_classes(course_acronyms)
+
+    if not course_acronyms:
+        logging.info("No courses found in the catalog. Aborting process.")
+        return
+
+    # pre-scan: nothing heavy (torch, whisper, the model) is loaded unless some class is missing a transcription
+    pending = catalog.get_pending_classes(MODEL_NAMES)
+    if not pending:
+        logging.info("Every catalogued class is already transcribed, nothing to do.")
+        return
+    logging.info(f"{len(pending)} classes pending in {len({course for course, _ in pending})} courses")
+
+    # courses with newly published classes go first, the rest are walked to
+    # resume anything left unfinished by previous runs
+    pending.sort(key=lambda job: job[0] not in new_classes)
+
+    # whisper no es thread-safe (https://github.com/openai/whisper/discussions/951) y el GIL
+    # serializa la inferencia, asi que cada worker de transcripcion es un proceso con su propio modelo.
+    # Los hilos de descarga solo encolan los videos validados, y se bloquean si la cola esta llena.
+    search_index = SearchIndex(catalog=catalog, journal_mode=journal_mode)
+    audio_cache = AudioCache(max_size=DISK_BUDGET)
+    with TranscriptionPipeline(
+        num_workers=1,
+        model_name=MODEL_NAMES[0],
+        audio_cache=audio_cache,
+        catalog=catalog,
+        search_index=search_index,
+        checkpoint_seconds=args.checkpoint_seconds,
+    ) as pipeline:
+        # the decoded audio of the workers counts against the same budget as the videos,
+        # and with several shards so do the downloads of the others
+        disk_budget = DiskBudget(
+            DISK_BUDGET,
+            model_names=MODEL_NAMES,
+            catalog=catalog,
+            audio_cache=audio_cache,
+            shared=shard_count > 1,
+        )
+        deduplicator = Deduplicator(
+            catalog, model_names=MODEL_NAMES, search_index=search_index
+        )
+        # the classes transcribed before sizes were stored can only be matched once HEADed
+        if shard_index == 0:
+            deduplicator.backfill_sizes()
+        course_downloader = CourseDownloader(
+            pipeline,
+            max_workers=2,
+            catalog=catalog,
+            disk_budget=disk_budget,
+            deduplicator=deduplicator,
+        )
 
-            for acronym in course_acronyms:
-                class_scraper.save_classes_to_file(acronym)
-        else:
-            logging.info(
-                f"Course acronyms file not found at {course_acronyms_path}. Aborting process."
-            )
-            return
-        course_scraper.update_timestamp()
-        class_scraper.update_timestamp()
-    else:
-        logging.info(
-            "CourseScraper and ClassScraper skipped as they were already run within the last week."
+        scheduler = Scheduler(
+            MODEL_NAMES[0],
+            args.policy,
+            args.time_limit * 60 if args.time_limit is not None else None,
+            catalog=catalog,
+            start_time=START_TIME,
         )
 
-    transcriber = Transcriber(model_name="medium")
-
-    course_downloader = CourseDownloader(transcriber, total_max_size=2 * BYTES_TO_GB)
-
-    if course_acronyms_path.exists():
-        with open(course_acronyms_path, "r", encoding="utf-8") as file:
-            course_acronyms = [line.strip() for line in file if line.strip()]
-
-        # TODO: modificar la concurrencia
-        # el main spawnea hilos que llaman al course_downloader.process_course que spawna mas hilos
-        # 1. whisper no es thread-safe https://github.com/openai/whisper/discussions/951
-        # 2. muchas veces el uso de hilos en python no tiene provecho por el Global Interpreter Lock. usar procesos en tal caso.
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            futures = {
-                executor.submit(
-                    download_course_videos, acronym, course_downloader
-                ): acronym
-                for acronym in course_acronyms
-            }
-
-        for future in tqdm(
-            as_completed(futures), total=len(futures), desc="Processing courses"
-        ):
-            acronym = futures[future]
+        if shard_count > 1:
+            own, stolen = get_shard_work(shards, set(pending), shard_index, new_classes)
+            logging.info(f"Shard {shard_index}/{shard_count}: {len(own)} own classes, {len(stolen)} to steal")
+            claims = ClassClaims()
             try:
-                future.result()
-                logging.info(f"Finished processing course: {acronym}")
-            except Exception as e:
-                logging.info(f"Error processing course {acronym}: {str(e)}")
+                course_downloader.process_jobs(own, claims, scheduler)
+                course_downloader.process_jobs(stolen, claims, scheduler)
+            finally:
+                # transcriptions are queued, wait for them before letting other shards in
+                pipeline.close()
+                claims.release_all()
+        else:
+            course_downloader.process_jobs(pending, scheduler=scheduler)
+
+        scheduler.report()
+        deduplicator.report()
 
 
 if __name__ == "__main__":
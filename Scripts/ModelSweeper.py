@@ -0,0 +1,118 @@
+import gc
+import logging
+from collections import OrderedDict
+from pathlib import Path
+
+import torch
+import whisper
+from constants import BYTES_TO_GB
+from Transcriber import Transcriber
+from TranscriptStore import transcript_exists
+
+# Approximate resident size of each checkpoint once loaded (fp32 weights + runtime overhead)
+MODEL_SIZES = {
+    "tiny": 0.2 * BYTES_TO_GB,
+    "base": 0.35 * BYTES_TO_GB,
+    "small": 1.1 * BYTES_TO_GB,
+    "medium": 3.1 * BYTES_TO_GB,
+    "large": 6.2 * BYTES_TO_GB,
+}
+
+
+class ModelSweeper:
+    """
+    Transcribe videos with several Whisper sizes, decoding each video only once.
+    Loaded models are kept in an LRU bounded by memory_budget, so two large
+    models are never resident at the same time when they don't fit together.
+    """
+
+    def __init__(
+        self,
+        model_names,
+        transcription_path="../DB/Transcripciones/",
+        memory_budget=4 * BYTES_TO_GB,
+        audio_cache=None,
+    ):
+        self.model_names = list(model_names)
+        self.transcription_path = transcription_path
+        self.memory_budget = memory_budget
+        self.audio_cache = audio_cache
+        self.transcribers = OrderedDict()
+        self.sweep_count = 0
+
+    def get_model_size(self, model_name):
+        return MODEL_SIZES.get(model_name.split(".")[0].split("-")[0], 0)
+
+    def get_resident_size(self):
+        return sum(self.get_model_size(name) for name in self.transcribers)
+
+    def get_transcriber(self, model_name):
+        """Return a Transcriber for model_name, loading it and evicting others if needed."""
+        if model_name in self.transcribers:
+            self.transcribers.move_to_end(model_name)
+            return self.transcribers[model_name]
+
+        required = self.get_model_size(model_name)
+        while (
+            self.transcribers
+            and self.get_resident_size() + required > self.memory_budget
+        ):
+            evicted_name, _ = self.transcribers.popitem(last=False)
+            logging.info(f"Unloading model {evicted_name} to fit {model_name}")
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+        logging.info(f"Loading model {model_name}")
+        self.transcribers[model_name] = Transcriber(
+            transcription_path=self.transcription_path,
+            model_name=model_name,
+            audio_cache=self.audio_cache,
+        )
+        return self.transcribers[model_name]
+
+    def get_pending_models(self, video_path, course_name):
+        pending = []
+        for model_name in self.model_names:
+            outputs = [
+                Path(self.transcription_path)
+                / language
+                / course_name
+                / f"{video_path.stem}_{model_name}.txt"
+                for language in ["es", "ad"]
+            ]
+            if not all(transcript_exists(path) for path in outputs):
+                pending.append(model_name)
+        return pending
+
+    def transcribe_video(self, video_path, course_name):
+        """Decode video_path once and run every pending model over the same audio."""
+        if not video_path.exists():
+            logging.info(f"Video file not found: {video_path}")
+            return
+
+        pending = self.get_pending_models(video_path, course_name)
+        if not pending:
+            logging.info(
+                f"All model transcriptions already exist for {video_path.stem}, skipping..."
+            )
+            return
+
+        # alternate the model order on every video so the model that is still
+        # resident from the previous video runs first instead of being reloaded
+        if self.sweep_count % 2 == 1:
+            pending.reverse()
+        self.sweep_count += 1
+
+        if self.audio_cache is not None:
+            audio = self.audio_cache.load_audio(video_path)
+        else:
+            audio = whisper.load_audio(str(video_path))
+
+        for model_name in pending:
+            transcriber = self.get_transcriber(model_name)
+            transcriber.transcribe_video(video_path, course_name, audio=audio)
+
+    def transcribe_videos(self, video_paths, course_name):
+        for video_path in video_paths:
+            self.transcribe_video(Path(video_path), course_name)
@@ -0,0 +1,76 @@
+import logging
+from pathlib import Path
+
+import torch
+import whisper
+
+
+def quantize_model(model):
+    """Apply dynamic int8 quantization to every linear layer of the encoder and decoder."""
+    # whisper.model.Linear only overrides forward to cast the weights to the input
+    # dtype, torch's quantizer only swaps exact nn.Linear instances
+    for module in model.modules():
+        if isinstance(module, whisper.model.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def load_quantized_model(model_name, cache_path="../DB/Models/"):
+    """
+    Load the int8 version of a whisper model, quantizing it on first use and caching
+    the quantized module on disk so later startups skip the float checkpoint.
+    """
+    model_path = Path(cache_path) / f"{model_name}_int8.pt"
+    if model_path.exists():
+        logging.info(f"Loading quantized model from {model_path}")
+        model = torch.load(model_path, map_location="cpu", weights_only=False)
+        model.eval()
+        return model
+
+    logging.info(f"Quantizing model {model_name} to int8")
+    model = quantize_model(whisper.load_model(model_name, device="cpu"))
+    model.eval()
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.save(model, model_path)
+    logging.info(f"Quantized model saved to {model_path}")
+    return model
+
+
+def check_accuracy(
+    model_name="small",
+    course_name="comp1-2024",
+    db_path="../DB/Opens/",
+    transcription_path="../DB/Transcripciones/",
+    output_path="../DB/TranscripcionesInt8/",
+):
+    """
+    Transcribe the videos of course_name with the int8 backend and report the WER
+    of each output against the existing float transcription of the same model.
+    """
+    from metrics import calculate_metrics
+    from Transcriber import Transcriber
+    from TranscriptStore import transcript_exists
+
+    transcriber = Transcriber(
+        transcription_path=output_path, model_name=model_name, backend="int8"
+    )
+    scores = {}
+    for video_path in sorted((Path(db_path) / course_name).glob("*.mp4")):
+        transcriber.transcribe_video(video_path, course_name)
+        for language in ["es", "ad"]:
+            name = f"{video_path.stem}_{model_name}.txt"
+            float_path = Path(transcription_path) / language / course_name / name
+            int8_path = Path(output_path) / language / course_name / name
+            if not transcript_exists(float_path) or not transcript_exists(int8_path):
+                logging.info(f"Missing {float_path} or {int8_path}, skipping...")
+                continue
+            scores[f"{video_path.stem}_{language}"] = calculate_metrics(float_path, int8_path)
+            logging.info(f"{video_path.stem} ({language}) int8 vs float: {scores[f'{video_path.stem}_{language}']}")
+    return scores
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    check_accuracy()
@@ -0,0 +1,195 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from constants import BYTES_TO_GB
+
+POLICIES = ["deadline", "shortest", "fewest-per-course"]
+
+# used until the telemetry of previous runs has measurements (GPU, single pass)
+DEFAULT_REAL_TIME_FACTORS = {
+    "tiny": 0.02,
+    "base": 0.03,
+    "small": 0.06,
+    "medium": 0.15,
+    "large": 0.3,
+}
+DEFAULT_BYTES_PER_AUDIO_SECOND = 80_000
+DEFAULT_DOWNLOAD_BYTES_PER_SECOND = 20_000_000
+# most recent telemetry files read to measure the cost model
+HISTORY_FILES = 50
+
+
+class Scheduler:
+    """
+    Orders the classes of a run and decides which ones are still worth starting.
+    The cost of a class is its estimated download time plus its audio length
+    (estimated from the video size) times the model's real-time factor. The
+    factors are measured from the inference, download and audio lengths in the
+    telemetry of previous runs, with defaults for a first run. The real-time
+    factor is per class, summing all its inference passes (a class whose
+    detected language isn't Spanish is transcribed twice).
+
+    Policies:
+    - deadline: keep the given priority order, the only reordering is skipping
+      the classes that no longer fit before the time limit (first fit).
+    - shortest: cheapest classes first, which maximises finished classes.
+    - fewest-per-course: round robin across courses, starting with the course
+      that has the fewest transcriptions, cheapest class first within a course.
+
+    With a time limit, admit() rejects a class whose predicted end falls after
+    the deadline, so the allocation isn't spent on work that would be killed.
+    It is called when the download or transcription of a class is about to
+    start, and cancel() gives the inference time back if it doesn't happen.
+    The time limit counts from start_time, when the process started, and the
+    end of the SLURM job (SLURM_JOB_END_TIME) is a deadline too when it is set.
+    """
+
+    def __init__(
+        self,
+        model_name="medium",
+        policy="deadline",
+        time_limit=None,
+        safety_margin=10 * 60,
+        catalog=None,
+        metrics_path="../Logs/Metrics/",
+        start_time=None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy {policy}, expected one of {POLICIES}")
+        self.model_name = model_name
+        self.policy = policy
+        self.catalog = catalog
+        self.deadline = self.get_deadline(time_limit, safety_margin, start_time)
+        self.lock = threading.Lock()
+        # predicted time at which the transcription worker is done with the admitted classes
+        self.busy_until = time.time()
+        self.admitted = 0
+        self.rejected = 0
+
+        self.real_time_factor = DEFAULT_REAL_TIME_FACTORS.get(model_name, 0.15)
+        self.bytes_per_audio_second = DEFAULT_BYTES_PER_AUDIO_SECOND
+        self.download_bytes_per_second = DEFAULT_DOWNLOAD_BYTES_PER_SECOND
+        self.load_history(Path(metrics_path))
+
+    def get_deadline(self, time_limit, safety_margin, start_time=None):
+        """The earliest of start_time + time_limit and the end of the SLURM job, minus the margin."""
+        ends = []
+        if time_limit is not None:
+            ends.append((start_time or time.time()) + time_limit)
+        if os.environ.get("SLURM_JOB_END_TIME"):
+            ends.append(float(os.environ["SLURM_JOB_END_TIME"]))
+        return min(ends) - safety_margin if ends else None
+
+    def load_history(self, metrics_path):
+        """Measure the cost model from the telemetry events of previous runs."""
+        download_seconds = download_bytes = 0.0
+        downloaded = {}
+        # (course, number) -> seconds of every inference pass, and its audio length
+        inference = {}
+        transcribed = {}
+        for events_path in sorted(metrics_path.glob("events_*.jsonl"))[-HISTORY_FILES:]:
+            with open(events_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if event["status"] != "ok":
+                        continue
+                    key = (event.get("course"), event.get("number"))
+                    if event["stage"] == "inference" and event.get("model") == self.model_name:
+                        inference[key] = inference.get(key, 0.0) + event["seconds"]
+                        transcribed[key] = event["audio_seconds"]
+                    elif event["stage"] == "download" and event.get("bytes"):
+                        download_seconds += event["seconds"]
+                        download_bytes += event["bytes"]
+                        downloaded[key] = event["bytes"]
+
+        audio_seconds = sum(transcribed.values())
+        if audio_seconds:
+            self.real_time_factor = sum(inference.values()) / audio_seconds
+        if download_seconds:
+            self.download_bytes_per_second = download_bytes / download_seconds
+        both = downloaded.keys() & transcribed.keys()
+        if both:
+            self.bytes_per_audio_second = sum(downloaded[k] for k in both) / sum(
+                transcribed[k] for k in both
+            )
+        logging.info(
+            f"Cost model for {self.model_name}: RTF {self.real_time_factor:.3f}, "
+            f"{self.bytes_per_audio_second / 1000:.0f} kB per audio second, "
+            f"download {self.download_bytes_per_second / 1e6:.1f} MB/s"
+        )
+
+    def get_costs(self, size):
+        """Return (download seconds, inference seconds) estimated for a video of size bytes."""
+        return (
+            size / self.download_bytes_per_second,
+            size / self.bytes_per_audio_second * self.real_time_factor,
+        )
+
+    def order(self, jobs):
+        """Order (course, number, url, size) jobs by the policy."""
+        if self.policy == "shortest":
+            return sorted(jobs, key=lambda job: job[3])
+        if self.policy == "fewest-per-course":
+            return self.order_fewest_per_course(jobs)
+        return list(jobs)
+
+    def order_fewest_per_course(self, jobs):
+        counts = self.catalog.get_transcribed_counts([self.model_name]) if self.catalog else {}
+        by_course = {}
+        for job in sorted(jobs, key=lambda job: job[3], reverse=True):
+            by_course.setdefault(job[0], []).append(job)
+        heap = [
+            (counts.get(course, 0), course_jobs[-1][3], course)
+            for course, course_jobs in by_course.items()
+        ]
+        heapq.heapify(heap)
+        ordered = []
+        while heap:
+            count, _, course = heapq.heappop(heap)
+            ordered.append(by_course[course].pop())
+            if by_course[course]:
+                heapq.heappush(heap, (count + 1, by_course[course][-1][3], course))
+        return ordered
+
+    def admit(self, course, number, size, download=True):
+        """
+        Reserve the predicted transcription time of a class if it ends before the
+        deadline. Without download the video is already on disk.
+        """
+        download_seconds, inference_seconds = self.get_costs(size)
+        if not download:
+            download_seconds = 0
+        with self.lock:
+            now = time.time()
+            finish = max(now + download_seconds, self.busy_until) + inference_seconds
+            if self.deadline is not None and finish > self.deadline:
+                self.rejected += 1
+                logging.info(
+                    f"Not starting {course}_{number} ({size / BYTES_TO_GB:.2f} GB), "
+                    f"predicted to end {(finish - self.deadline) / 60:.0f} min after the deadline"
+                )
+                return False
+            self.busy_until = finish
+            self.admitted += 1
+        return True
+
+    def cancel(self, size):
+        """Give back the transcription time reserved for an admitted class that won't be transcribed."""
+        _, inference_seconds = self.get_costs(size)
+        with self.lock:
+            self.busy_until = max(self.busy_until - inference_seconds, time.time())
+            self.admitted -= 1
+
+    def report(self):
+        logging.info(
+            f"Scheduler ({self.policy}): {self.admitted} classes started, "
+            f"{self.rejected} left for the next run"
+        )
@@ -0,0 +1,273 @@
+import argparse
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+from Catalog import Catalog, split_video_stem
+from TranscriptStore import SUFFIX, Transcript
+
+# segment_rows holds the data, segments is an FTS5 index over its text. The
+# unicode61 tokenizer folds case and strips accents ("Árbol" matches "arbol")
+# and the prefix indexes keep short prefix queries from scanning the vocabulary.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    course TEXT NOT NULL,
+    number TEXT NOT NULL,
+    model TEXT NOT NULL,
+    language TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segment_rows (
+    id INTEGER PRIMARY KEY,
+    document INTEGER NOT NULL REFERENCES documents(id),
+    start REAL,
+    end REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segment_rows_document ON segment_rows (document);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments USING fts5(
+    text,
+    content='segment_rows',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS segment_rows_insert AFTER INSERT ON segment_rows BEGIN
+    INSERT INTO segments (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segment_rows_delete AFTER DELETE ON segment_rows BEGIN
+    INSERT INTO segments (segments, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+def build_query(text):
+    """
+    Translate a user query into FTS5 syntax. Words are ANDed, "quoted words" are a
+    phrase and a trailing * makes the last word a prefix (deriv* or "serie de tay*").
+    Punctuation is dropped so user input can never be an FTS5 syntax error.
+    """
+    parts = []
+    for phrase, term in re.findall(r'"([^"]*)"|(\S+)', text):
+        raw = phrase or term
+        words = re.findall(r"\w+", raw)
+        if not words:
+            continue
+        part = '"' + " ".join(words) + '"'
+        if raw.rstrip().endswith("*"):
+            part += " *"
+        parts.append(part)
+    return " ".join(parts)
+
+
+def format_time(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class SearchIndex:
+    """
+    Full-text index of transcript segments, stored in SQLite FTS5. Every segment is
+    indexed with its course, class, model, language and start time, so a hit can
+    link to the second of the lecture where it is said. Like Catalog, the
+    connection is opened lazily per process so the index can be handed to workers.
+    """
+
+    def __init__(self, db_path="../DB/search.sqlite3", catalog=None, journal_mode="WAL"):
+        self.db_path = Path(db_path)
+        self.catalog = catalog
+        # "DELETE" when several nodes write to it over a network filesystem, see Catalog
+        self.journal_mode = journal_mode
+        self._connection = None
+        self._pid = None
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        return {"db_path": self.db_path, "catalog": self.catalog, "journal_mode": self.journal_mode}
+
+    def __setstate__(self, state):
+        self.__init__(state["db_path"], state["catalog"], state["journal_mode"])
+
+    @property
+    def connection(self):
+        if self._connection is None or self._pid != os.getpid():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False, timeout=30
+            )
+            self._connection.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def add_transcript(self, path, result=None):
+        """
+        Index the transcription at <language>/<course>/<course>_<nn>_<model>.{seg,txt},
+        replacing a previous version of it. result is the whisper result that was
+        just written, if the caller has it; otherwise the file is read.
+        """
+        path = Path(path)
+        video_stem, model = path.stem.rsplit("_", 1)
+        course, number = split_video_stem(video_stem)
+        language = path.parent.parent.name
+
+        if result is not None:
+            segments = [
+                (segment.get("start"), segment.get("end"), segment["text"])
+                for segment in result.get("segments") or [{"text": result["text"]}]
+            ]
+        elif path.suffix == SUFFIX:
+            transcript = Transcript(path)
+            segments = [
+                (round(float(start), 2), round(float(end), 2), transcript.segment_text(i))
+                for i, (start, end) in enumerate(zip(transcript["start"], transcript["end"]))
+            ]
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                segments = [(None, None, f.read())]
+        # transcripts without timing (legacy .txt) are stored with NULL times
+        segments = [
+            (
+                None if start is None or math.isnan(start) else start,
+                None if end is None or math.isnan(end) else end,
+                text,
+            )
+            for start, end, text in segments
+            if text.strip()
+        ]
+
+        with self.lock:
+            db = self.connection
+            with db:
+                # drop the previous version, and the legacy .txt a .seg file replaces
+                for (previous,) in db.execute(
+                    "SELECT id FROM documents WHERE path IN (?, ?)",
+                    (str(path), str(path.with_suffix(".txt"))),
+                ).fetchall():
+                    db.execute("DELETE FROM segment_rows WHERE document = ?", (previous,))
+                    db.execute("DELETE FROM documents WHERE id = ?", (previous,))
+                document = db.execute(
+                    """
+                    INSERT INTO documents (path, course, number, model, language, mtime_ns)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (str(path), course, number, model, language, path.stat().st_mtime_ns),
+                ).lastrowid
+                db.executemany(
+                    "INSERT INTO segment_rows (document, start, end, text) VALUES (?, ?, ?, ?)",
+                    [(document, start, end, text) for start, end, text in segments],
+                )
+        return len(segments)
+
+    def update(self, transcriptions_path="../DB/Transcripciones/"):
+        """Index every new or modified transcription under transcriptions_path/{ad,es}."""
+        with self.lock:
+            indexed = dict(self.connection.execute("SELECT path, mtime_ns FROM documents"))
+        added = 0
+        for language in ["ad", "es"]:
+            for path in sorted((Path(transcriptions_path) / language).glob("*/*_*.*")):
+                if path.suffix not in (".txt", SUFFIX):
+                    continue
+                if path.suffix == ".txt" and path.with_suffix(SUFFIX).exists():
+                    continue
+                if indexed.get(str(path)) == path.stat().st_mtime_ns:
+                    continue
+                self.add_transcript(path)
+                added += 1
+        logging.info(f"Indexed {added} transcriptions into {self.db_path}")
+        return added
+
+    def get_video_url(self, course, number):
+        if self.catalog is None:
+            return None
+        rows = self.catalog.query(
+            "SELECT url FROM classes WHERE course = ? AND number = ?", (course, number)
+        )
+        return rows[0][0] if rows else None
+
+    def search(self, query, limit=20, course=None, model=None, language=None):
+        """
+        Return the best matching segments for query (see build_query), each with its
+        position in the lecture and a link that starts the video at that second.
+        """
+        match = build_query(query)
+        if not match:
+            return []
+        filters = ""
+        params = [match]
+        for column, value in [("course", course), ("model", model), ("language", language)]:
+            if value is not None:
+                filters += f" AND d.{column} = ?"
+                params.append(value)
+        params.append(limit)
+        with self.lock:
+            rows = self.connection.execute(
+                f"""
+                SELECT d.course, d.number, d.model, d.language, r.start, r.end,
+                       snippet(segments, 0, '[', ']', '...', 16)
+                FROM segments
+                JOIN segment_rows r ON r.id = segments.rowid
+                JOIN documents d ON d.id = r.document
+                WHERE segments MATCH ?{filters}
+                ORDER BY bm25(segments)
+                LIMIT ?
+                """,
+                params,
+            ).fetchall()
+
+        hits = []
+        for course_name, number, model_name, language_name, start, end, snippet in rows:
+            url = self.get_video_url(course_name, number)
+            if url is not None and start is not None:
+                url = f"{url}#t={int(start)}"
+            hits.append(
+                {
+                    "course": course_name,
+                    "number": number,
+                    "model": model_name,
+                    "language": language_name,
+                    "start": start,
+                    "end": end,
+                    "text": snippet,
+                    "url": url,
+                }
+            )
+        return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the lecture transcriptions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update_parser = subparsers.add_parser("update", help="index new or modified transcriptions")
+    update_parser.add_argument("--path", default="../DB/Transcripciones/")
+    query_parser = subparsers.add_parser("query", help='e.g. \'"transformada de fourier" discret*\'')
+    query_parser.add_argument("query")
+    query_parser.add_argument("--limit", type=int, default=20)
+    query_parser.add_argument("--course")
+    query_parser.add_argument("--model")
+    # the Spanish output always exists and is usually identical to the auto-detected one
+    query_parser.add_argument("--language", default="es")
+    args = parser.parse_args()
+
+    index = SearchIndex(catalog=Catalog())
+    if args.command == "update":
+        index.update(args.path)
+        return
+
+    for hit in index.search(args.query, args.limit, args.course, args.model, args.language):
+        position = format_time(hit["start"]) if hit["start"] is not None else "-"
+        print(f"{hit['course']}_{hit['number']} ({hit['model']}) {position}  {hit['text']}")
+        if hit["url"]:
+            print(f"    {hit['url']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    main()
@@ -0,0 +1,208 @@
+import heapq
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+LEASE_SECONDS = 10 * 60
+
+
+def get_shard(shard_index=None, shard_count=None):
+    """
+    Return (index, count) of this task, from the arguments or else from the SLURM
+    array variables. A job that is not an array is shard 0 of 1.
+    """
+    if shard_count is None:
+        shard_count = int(os.environ.get("SLURM_ARRAY_TASK_COUNT", 1))
+    if shard_index is None:
+        task_id = int(os.environ.get("SLURM_ARRAY_TASK_ID", 0))
+        shard_index = task_id - int(os.environ.get("SLURM_ARRAY_TASK_MIN", 0))
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} out of range for {shard_count} shards")
+    return shard_index, shard_count
+
+
+def assign_shards(classes, shard_count):
+    """
+    Split (course, number, expected_size) classes into shard_count lists of similar
+    total bytes: biggest classes first, each to the least loaded shard (ties go to
+    the lowest index). Classes whose size is still unknown count as the mean size.
+    The result only depends on its input, but shards that read the catalog at
+    different times see different inputs, see get_assignment. Each list keeps
+    the order of classes.
+    """
+    known = [size for _, _, size in classes if size]
+    default_size = sum(known) // len(known) if known else 1
+    order = sorted(
+        range(len(classes)),
+        key=lambda i: (-(classes[i][2] or default_size), classes[i][0], classes[i][1]),
+    )
+    loads = [(0, shard) for shard in range(shard_count)]
+    assigned = {}
+    for i in order:
+        load, shard = heapq.heappop(loads)
+        assigned[i] = shard
+        heapq.heappush(loads, (load + (classes[i][2] or default_size), shard))
+    shards = [[] for _ in range(shard_count)]
+    for i, cls in enumerate(classes):
+        shards[assigned[i]].append(cls)
+    return shards
+
+
+def get_assignment(classes, shard_index, shard_count, claims_path="../DB/Claims/", timeout=10 * 60):
+    """
+    Return assign_shards of the catalog classes as shard 0 saw them when the job
+    started. Shard 0 computes it from classes() and saves it in claims_path; the
+    other shards wait for that file instead of splitting their own view of a
+    catalog that shard 0 is still scraping into, so every shard uses the same
+    split. The file is per SLURM array job. Outside an array job, or if it
+    doesn't show up in time, the split is computed locally: the claims still
+    keep the shards from processing the same class, only the balance suffers.
+    """
+    job_id = os.environ.get("SLURM_ARRAY_JOB_ID")
+    path = Path(claims_path) / f"assignment_{job_id}.json"
+    if job_id is None:
+        return assign_shards(classes(), shard_count)
+
+    if shard_index == 0:
+        shards = assign_shards(classes(), shard_count)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(shards, f)
+        os.replace(tmp_path, path)
+        return shards
+
+    deadline = time.time() + timeout
+    while not path.exists():
+        if time.time() > deadline:
+            logging.info(f"No shard assignment at {path} after {timeout} s, computing it locally")
+            return assign_shards(classes(), shard_count)
+        time.sleep(5)
+    with open(path, "r", encoding="utf-8") as f:
+        return [[tuple(cls) for cls in shard] for shard in json.load(f)]
+
+
+class ClassClaims:
+    """
+    Claims on individual classes, shared by all shards through files in
+    claims_path. A claim is created with O_CREAT | O_EXCL, which is atomic on
+    the shared filesystem, so exactly one shard processes each class no matter
+    whether it owns it or steals it. A claim file holds its owner and is
+    refreshed by a heartbeat. A claim whose owner stopped refreshing it for
+    lease_seconds (the job was killed) is taken over under a short-lived
+    <key>.claim.lock file, also created with O_EXCL: the taker re-reads the
+    owner and age under the lock and atomically replaces the file with its own,
+    so a claim that was refreshed or re-claimed meanwhile is never dropped.
+    """
+
+    def __init__(self, claims_path="../DB/Claims/", owner=None, lease_seconds=LEASE_SECONDS):
+        self.claims_path = Path(claims_path)
+        self.claims_path.mkdir(parents=True, exist_ok=True)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.heartbeat = threading.Thread(target=self.refresh, daemon=True)
+        self.heartbeat.start()
+
+    def get_path(self, key):
+        return self.claims_path / f"{key}.claim"
+
+    def claim(self, key):
+        """Try to claim key. Returns True if this process now holds it."""
+        path = self.get_path(key)
+        with self.lock:
+            if key in self.held:
+                return True
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self.take_over(path):
+                return False
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.owner)
+        with self.lock:
+            self.held.add(key)
+        return True
+
+    def get_owner(self, path):
+        """Return (owner, age in seconds) of the claim at path, or None if there is none."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                owner = f.read()
+            return owner, time.time() - path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def take_over(self, path):
+        """Make the claim at path ours if its lease expired. Returns True if it is ours now."""
+        claim = self.get_owner(path)
+        if claim is None or claim[1] < self.lease_seconds:
+            return False
+        lock_path = path.with_name(path.name + ".lock")
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # a taker killed inside the lock would block the class forever
+            try:
+                if time.time() - lock_path.stat().st_mtime > self.lease_seconds:
+                    lock_path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+            return False
+        os.close(fd)
+        try:
+            # the owner may have refreshed it, or another shard taken it over, since we looked
+            current = self.get_owner(path)
+            if current is None or current[0] != claim[0] or current[1] < self.lease_seconds:
+                return False
+            tmp_path = path.with_name(f"{path.name}.{self.owner.replace(':', '_')}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.owner)
+            os.replace(tmp_path, path)
+        finally:
+            lock_path.unlink(missing_ok=True)
+        logging.info(f"Took over expired claim {path.name} from {claim[0]}")
+        return True
+
+    def is_owner(self, key):
+        claim = self.get_owner(self.get_path(key))
+        return claim is not None and claim[0] == self.owner
+
+    def release(self, key):
+        with self.lock:
+            if key not in self.held:
+                return
+            self.held.discard(key)
+        # the claim may have been taken over after our lease lapsed, leave that one alone
+        if self.is_owner(key):
+            self.get_path(key).unlink(missing_ok=True)
+
+    def release_all(self):
+        self.stop.set()
+        with self.lock:
+            held, self.held = self.held, set()
+        for key in held:
+            if self.is_owner(key):
+                self.get_path(key).unlink(missing_ok=True)
+
+    def refresh(self):
+        while not self.stop.wait(self.lease_seconds / 4):
+            with self.lock:
+                held = list(self.held)
+            for key in held:
+                if not self.is_owner(key):
+                    logging.info(f"Lost the claim on {key} to another shard, its lease had expired")
+                    with self.lock:
+                        self.held.discard(key)
+                    continue
+                try:
+                    os.utime(self.get_path(key))
+                except FileNotFoundError:
+                    pass
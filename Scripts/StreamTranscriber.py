@@ -0,0 +1,186 @@
+import logging
+import queue
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+from Transcriber import split_window
+from TranscriptStore import transcript_exists
+
+SAMPLE_RATE = 16000
+WINDOW_SECONDS = 30
+READ_SIZE = 64 * 1024
+PROMPT_CHARS = 200
+
+
+class StreamTranscriber:
+    """
+    Transcribe a lecture while it is being downloaded, without persisting the mp4.
+    ffmpeg reads the video straight from its URL (seeking with range requests when
+    the moov atom sits at the end of the file) and emits 16 kHz mono PCM. Whisper
+    runs on each 30 s window as soon as it is complete, and the windows are split
+    into finished segments and the next window's start with split_window.
+    With keep_audio the original audio track is also copied, without
+    re-encoding, next to where the video would have been saved. Nothing reads
+    it back or evicts it, so it is off by default.
+    """
+
+    def __init__(self, transcriber, window_seconds=WINDOW_SECONDS, keep_audio=False):
+        self.transcriber = transcriber
+        self.window_seconds = window_seconds
+        self.keep_audio = keep_audio
+
+    def get_audio_path(self, video_path):
+        return Path(video_path).with_suffix(".m4a")
+
+    def build_command(self, video_url, video_path):
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", video_url]
+        if self.keep_audio:
+            cmd += ["-map", "0:a:0", "-vn", "-c:a", "copy", str(self.get_audio_path(video_path))]
+        cmd += ["-map", "0:a:0", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+        return cmd
+
+    def read_pcm(self, stream, blocks):
+        """Drain ffmpeg's stdout so the download never stalls while Whisper is busy."""
+        while True:
+            block = stream.read(READ_SIZE)
+            if not block:
+                break
+            blocks.put(block)
+        blocks.put(None)
+
+    def iter_audio(self, blocks):
+        """Yield the decoded audio as float32 arrays, as it arrives."""
+        remainder = b""
+        while True:
+            block = blocks.get()
+            if block is None:
+                break
+            block = remainder + block
+            remainder = block[len(block) - len(block) % 2 :]
+            yield self.to_float(block[: len(block) - len(remainder)])
+
+    def to_float(self, pcm):
+        return np.frombuffer(bytes(pcm), np.int16).astype(np.float32) / 32768.0
+
+    def transcribe_window(self, audio, language, result, offset, final):
+        """
+        Transcribe one window starting at offset seconds into result and return how
+        many seconds of it are done.
+        """
+        window = self.transcriber.model.transcribe(
+            audio,
+            language=language,
+            initial_prompt=result["text"][-PROMPT_CHARS:] or None,
+        )
+        segments, done = split_window(window["segments"], len(audio) / SAMPLE_RATE, final)
+        for segment in segments:
+            segment = dict(segment)
+            segment["id"] = len(result["segments"])
+            segment["start"] += offset
+            segment["end"] += offset
+            result["segments"].append(segment)
+            result["text"] += segment["text"]
+        return done
+
+    def transcribe_url(self, video_url, video_path, course_name):
+        """Stream-transcribe video_url. Returns False if the stream could not be decoded."""
+        video_path = Path(video_path)
+        video_stem = video_path.stem
+        spanish_path, autodetect_path = self.transcriber.get_output_paths(
+            video_stem, course_name
+        )
+        if transcript_exists(spanish_path) and transcript_exists(autodetect_path):
+            logging.info(
+                f"Transcriptions already exist for {video_stem}, skipping..."
+            )
+            return True
+        spanish_path.parent.mkdir(parents=True, exist_ok=True)
+        autodetect_path.parent.mkdir(parents=True, exist_ok=True)
+        video_path.parent.mkdir(parents=True, exist_ok=True)
+
+        logging.info(f"Streaming transcription of {video_url}")
+        # ffmpeg's errors go to a file, a full stderr pipe would stall the stream
+        stderr_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            self.build_command(video_url, video_path),
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+        )
+        blocks = queue.Queue()
+        reader = threading.Thread(
+            target=self.read_pcm, args=(process.stdout, blocks), daemon=True
+        )
+        reader.start()
+
+        # output path -> language passed to whisper, None until detected
+        targets = {}
+        if not transcript_exists(spanish_path):
+            targets[spanish_path] = "es"
+        if not transcript_exists(autodetect_path):
+            targets[autodetect_path] = None
+        results = {path: {"text": "", "segments": []} for path in targets}
+        # samples transcribed by each target; audio holds everything after the smallest
+        seeks = {path: 0 for path in targets}
+        audio = np.empty(0, np.float32)
+        audio_start = 0
+        window = self.window_seconds * SAMPLE_RATE
+        logged_minutes = 0
+
+        def transcribe_pending(final):
+            nonlocal audio, audio_start
+            end = audio_start + len(audio)
+            for path in list(targets):
+                while end - seeks[path] >= window or (final and seeks[path] < end):
+                    window_audio = audio[seeks[path] - audio_start :][:window]
+                    if path == autodetect_path and targets[path] is None:
+                        language = self.transcriber.detect_language(window_audio)
+                        logging.info(f"Detected language for {video_stem}: {language}")
+                        if language == "es" and spanish_path in targets:
+                            # the auto-detected output is the Spanish one, transcribe once
+                            del targets[path]
+                            results[path] = results[spanish_path]
+                            break
+                        targets[path] = language
+                    done = self.transcribe_window(
+                        window_audio,
+                        targets[path],
+                        results[path],
+                        seeks[path] / SAMPLE_RATE,
+                        final and seeks[path] + window >= end,
+                    )
+                    seeks[path] += max(int(done * SAMPLE_RATE), 1)
+            if targets:
+                keep_from = min(seeks[path] for path in targets)
+                audio = audio[keep_from - audio_start :]
+                audio_start = keep_from
+
+        try:
+            for block in self.iter_audio(blocks):
+                audio = np.concatenate([audio, block])
+                transcribe_pending(final=False)
+                minutes = int(audio_start / SAMPLE_RATE // 300) * 5
+                if minutes > logged_minutes:
+                    logged_minutes = minutes
+                    logging.info(
+                        f"Transcribed {minutes} minutes of {video_stem} while streaming"
+                    )
+            if audio_start + len(audio):
+                transcribe_pending(final=True)
+        finally:
+            process.stdout.close()
+            process.wait()
+            reader.join()
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors="replace")
+            stderr_file.close()
+
+        if process.returncode != 0 or audio_start + len(audio) == 0:
+            logging.info(f"Failed to stream {video_url}: {stderr.strip()}")
+            return False
+
+        for path, result in results.items():
+            self.transcriber.write_transcription(path, result)
+        return True
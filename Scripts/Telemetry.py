@@ -0,0 +1,154 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+FLUSH_SECONDS = 5
+
+
+class Telemetry:
+    """
+    Structured per-stage timing for the pipeline. span() only puts the finished
+    event on an in-memory queue; a background thread writes the events as JSON
+    lines and keeps a Prometheus text file with per-stage totals up to date,
+    so instrumented code never waits on the disk. Every process (transcription
+    workers are spawned) writes its own pair of files.
+    """
+
+    def __init__(self, output_path="../Logs/Metrics/", flush_seconds=FLUSH_SECONDS):
+        self.output_path = Path(output_path)
+        self.flush_seconds = flush_seconds
+        self.enabled = os.environ.get("TELEMETRY", "1") != "0"
+        self.events = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.writer = None
+        self.pid = None
+        # (stage, course, status) -> [count, seconds, bytes]
+        self.totals = {}
+
+    def start(self):
+        """Start the writer thread of this process, once."""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.events = queue.SimpleQueue()
+            self.totals = {}
+            self.output_path.mkdir(parents=True, exist_ok=True)
+            run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self.pid}"
+            self.events_path = self.output_path / f"events_{run_id}.jsonl"
+            self.prometheus_path = self.output_path / f"metrics_{run_id}.prom"
+            self.writer = threading.Thread(target=self.write_events, daemon=True)
+            self.writer.start()
+            atexit.register(self.close)
+
+    def record(self, stage, seconds, status="ok", **fields):
+        if not self.enabled:
+            return
+        if self.pid != os.getpid():
+            self.start()
+        self.events.put(
+            {
+                "time": datetime.now().isoformat(timespec="milliseconds"),
+                "stage": stage,
+                "seconds": round(seconds, 6),
+                "status": status,
+                **fields,
+            }
+        )
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """
+        Time the enclosed block as one event of stage. The yielded dict can be used
+        to attach fields known only at the end, e.g. span["bytes"] = size.
+        """
+        fields = dict(labels)
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield fields
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, status, **fields)
+
+    def write_events(self):
+        with open(self.events_path, "a", encoding="utf-8") as f:
+            while True:
+                batch = self.drain(self.flush_seconds)
+                closing = None in batch
+                for event in batch:
+                    if event is None:
+                        continue
+                    if event.get("bytes") and event["seconds"] > 0:
+                        event["bytes_per_second"] = round(event["bytes"] / event["seconds"])
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+                    key = (event["stage"], event.get("course", ""), event["status"])
+                    total = self.totals.setdefault(key, [0, 0.0, 0])
+                    total[0] += 1
+                    total[1] += event["seconds"]
+                    total[2] += event.get("bytes") or 0
+                f.flush()
+                if batch:
+                    self.write_prometheus()
+                if closing:
+                    return
+
+    def drain(self, timeout):
+        """Block for the first event up to timeout, then take everything queued."""
+        batch = []
+        try:
+            batch.append(self.events.get(timeout=timeout))
+            while True:
+                batch.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def write_prometheus(self):
+        lines = [
+            "# HELP pipeline_stage_spans_total Finished spans per pipeline stage.",
+            "# TYPE pipeline_stage_spans_total counter",
+        ]
+        samples = {"count": [], "seconds": [], "bytes": []}
+        for (stage, course, status), (count, seconds, size) in sorted(self.totals.items()):
+            labels = f'stage="{stage}",course="{course}",status="{status}"'
+            samples["count"].append(f"pipeline_stage_spans_total{{{labels}}} {count}")
+            samples["seconds"].append(f"pipeline_stage_seconds_total{{{labels}}} {seconds:.6f}")
+            if size:
+                samples["bytes"].append(f"pipeline_stage_bytes_total{{{labels}}} {size}")
+        lines += samples["count"]
+        lines += [
+            "# HELP pipeline_stage_seconds_total Wall time spent per pipeline stage.",
+            "# TYPE pipeline_stage_seconds_total counter",
+            *samples["seconds"],
+            "# HELP pipeline_stage_bytes_total Bytes processed per pipeline stage.",
+            "# TYPE pipeline_stage_bytes_total counter",
+            *samples["bytes"],
+        ]
+        tmp_path = self.prometheus_path.with_name(self.prometheus_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
+
+    def close(self):
+        """Flush the queued events and stop the writer."""
+        if self.writer is None or self.pid != os.getpid():
+            return
+        self.events.put(None)
+        self.writer.join(timeout=30)
+        self.writer = None
+        self.pid = None
+        logging.info(f"Pipeline metrics saved to {self.events_path}")
+
+
+telemetry = Telemetry()
+span = telemetry.span
@@ -1,17 +1,97 @@
 import logging
+import os
+import shutil
 from os import PathLike
 from pathlib import Path
 
-import torch
-import whisper
+from Catalog import split_video_stem
+from Telemetry import span
+from TranscriptionCheckpoint import TranscriptionCheckpoint
+from TranscriptStore import SUFFIX, transcript_exists, write_transcript
+from VoiceActivity import SAMPLE_RATE
+
+# whisper's mel frames per second (HOP_LENGTH of 160 samples), the unit of segment["seek"]
+FRAMES_PER_SECOND = SAMPLE_RATE // 160
+# a window transcribed piece by piece moves on at least this far, so a segment near
+# its start doesn't make the next window almost the same one
+MIN_ADVANCE_SECONDS = 1
+
+
+def split_window(segments, duration, final):
+    """
+    Return (segments to keep, seconds done) of a window transcribed on its own. Like
+    whisper's seek loop, unless final the last segment is decoded again at the start
+    of the next window, since it may be cut at the window edge. If it starts too close
+    to the window start, it is kept and the next window starts where it ends.
+    """
+    if final or not segments:
+        return segments, duration
+    if segments[-1]["start"] >= MIN_ADVANCE_SECONDS:
+        return segments[:-1], segments[-1]["start"]
+    if segments[-1]["end"] >= MIN_ADVANCE_SECONDS:
+        return segments, min(segments[-1]["end"], duration)
+    return segments, duration
+
+
+def detect_language(model, audio):
+    """Detect the spoken language from the first 30 s window of the decoded audio."""
+    import whisper
+
+    mel = whisper.log_mel_spectrogram(
+        whisper.pad_or_trim(audio), model.dims.n_mels
+    ).to(model.device)
+    _, probs = model.detect_language(mel)
+    return max(probs, key=probs.get)
 
 
 class Transcriber:
     def __init__(
-        self, transcription_path="../DB/Transcripciones/", model_name="tiny"
+        self,
+        transcription_path="../DB/Transcripciones/",
+        model_name="tiny",
+        single_pass=True,
+        audio_cache=None,
+        catalog=None,
+        vad=None,
+        chunked=None,
+        backend="torch",
+        output_format="seg",
+        search_index=None,
+        checkpoint_seconds=None,
     ):
         self.transcription_path = transcription_path
         self.model_name = model_name
+        self.single_pass = single_pass
+        self.audio_cache = audio_cache
+        self.catalog = catalog
+        self.vad = vad
+        self.chunked = chunked
+        self.backend = backend
+        self.search_index = search_index
+        # save progress every checkpoint_seconds of audio. Off by default: each window is
+        # a separate model.transcribe call, which doesn't decode exactly like whisper's seek loop
+        self.checkpoint_seconds = checkpoint_seconds
+        # "seg" keeps text, segments and confidences in one columnar file, "txt" only the text
+        self.output_suffix = SUFFIX if output_format == "seg" else ".txt"
+        self._model = None
+
+    @property
+    def model(self):
+        """The whisper model, loaded on first use so runs with nothing to transcribe never import torch."""
+        if self._model is None:
+            self._model = self.load_model()
+        return self._model
+
+    def load_model(self):
+        import torch
+        import whisper
+
+        if self.backend == "int8":
+            # dynamic int8 quantization only has CPU kernels
+            from QuantizedBackend import load_quantized_model
+
+            logging.info("Using device: cpu (int8 backend)")
+            return load_quantized_model(self.model_name)
 
         device = (
             "cuda:0"
@@ -23,26 +103,153 @@ class Transcriber:
 
         logging.info(f"Using device: {device}")
 
-        self.model = whisper.load_model(
+        return whisper.load_model(
             self.model_name,
             device=device,
             in_memory=True,
         )
 
-    def transcribe_video(self, video_path : PathLike, course_name):
+    def load_audio(self, video_path: PathLike):
+        """Decode the video soundtrack to 16 kHz mono float32 PCM."""
+        if self.audio_cache is not None:
+            return self.audio_cache.load_audio(video_path)
+        import whisper
+
+        return whisper.load_audio(str(video_path))
+
+    def detect_language(self, audio):
+        if self.chunked is not None:
+            # the pool already holds the model, don't load another copy here
+            return self.chunked.detect_language(audio[: 30 * SAMPLE_RATE], self.model_name)
+        return detect_language(self.model, audio)
+
+    def transcribe_audio(self, audio, timeline=None, checkpoint_path=None, **options):
+        """Run the model over decoded audio, mapping timestamps back to the original video."""
+        if self.chunked is not None:
+            result = self.chunked.transcribe(audio, self.model_name, **options)
+        else:
+            options.setdefault("fp16", self.model.device.type == "cuda")
+            if checkpoint_path is not None and self.checkpoint_seconds:
+                result = self.transcribe_with_checkpoints(audio, checkpoint_path, **options)
+            else:
+                result = self.model.transcribe(audio, **options)
+        if timeline is not None:
+            timeline.remap(result)
+        return result
+
+    def transcribe_with_checkpoints(self, audio, checkpoint_path, **options):
+        """
+        Transcribe audio one window at a time, appending the finished segments to a
+        checkpoint so a killed job resumes from the last window, conditioned on the
+        text transcribed so far, instead of from the start. Windows are split with
+        split_window.
+        """
+        sample_rate = SAMPLE_RATE
+        total = len(audio) / sample_rate
+        checkpoint = TranscriptionCheckpoint(checkpoint_path)
+        header = {"model": self.model_name, "samples": len(audio), **options}
+        seek = checkpoint.load(header)
+        checkpoint.start(header)
+
+        language = options.get("language")
+        while seek < total:
+            end = min(seek + self.checkpoint_seconds, total)
+            prompt = checkpoint.get_prompt() or options.get("initial_prompt")
+            result = self.model.transcribe(
+                audio[int(seek * sample_rate) : int(end * sample_rate)],
+                **{**options, "initial_prompt": prompt},
+            )
+            language = result.get("language", language)
+            segments, done = split_window(result["segments"], end - seek, end >= total)
+            next_seek = seek + done
+            for segment in segments:
+                segment["seek"] += round(seek * FRAMES_PER_SECOND)
+                segment["start"] += seek
+                segment["end"] += seek
+                for word in segment.get("words", []):
+                    word["start"] += seek
+                    word["end"] += seek
+            checkpoint.append(segments, next_seek)
+            seek = next_seek
+
+        segments = checkpoint.segments
+        for i, segment in enumerate(segments):
+            segment["id"] = i
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": language,
+        }
+
+    def get_checkpoint_path(self, path):
+        return path.with_name(f"{path.stem}.partial.jsonl")
+
+    def get_labels(self, video_stem):
+        course, number = split_video_stem(video_stem)
+        return {"course": course, "number": number, "model": self.model_name}
+
+    def write_transcription(self, path, result):
+        video_stem = path.stem.rsplit("_", 1)[0]
+        with span("write", language=path.parent.parent.name, **self.get_labels(video_stem)):
+            if path.suffix == SUFFIX:
+                write_transcript(path, result, model=self.model_name)
+            else:
+                with open(path, "w") as f:
+                    f.write(result["text"])
+        logging.info(f"Transcription saved to {path}")
+        TranscriptionCheckpoint(self.get_checkpoint_path(path)).remove()
+        if self.catalog is not None:
+            self.catalog.record_transcription(path)
+        if self.search_index is not None:
+            self.search_index.add_transcript(path, result)
+
+    def copy_transcription(self, source_path, path):
+        """Hard link, or copy, an existing transcription to path and record it like a written one."""
+        if not source_path.exists():
+            # legacy .txt layout
+            source_path = source_path.with_suffix(".txt")
+            path = path.with_suffix(".txt")
+        try:
+            os.link(source_path, path)
+        except OSError:
+            shutil.copy2(source_path, path)
+        logging.info(f"Transcription saved to {path}")
+        if self.catalog is not None:
+            self.catalog.record_transcription(path)
+        if self.search_index is not None:
+            self.search_index.add_transcript(path)
+
+    def get_output_paths(self, video_stem, course_name):
+        """Return the Spanish and auto-detected transcription paths for a video."""
+        spanish_path = (
+            Path(self.transcription_path)
+            / "es"
+            / course_name
+            / f"{video_stem}_{self.model_name}{self.output_suffix}"
+        )
+        autodetect_path = (
+            Path(self.transcription_path)
+            / "ad"
+            / course_name
+            / f"{video_stem}_{self.model_name}{self.output_suffix}"
+        )
+        return spanish_path, autodetect_path
+
+    def is_transcribed(self, video_path: PathLike, course_name):
+        return all(
+            transcript_exists(path)
+            for path in self.get_output_paths(Path(video_path).stem, course_name)
+        )
+
+    def transcribe_video(self, video_path : PathLike, course_name, audio=None):
+        """
+        Transcribe a video into its Spanish and auto-detected outputs.
+        audio can be passed to reuse PCM that was already decoded by the caller.
+        """
         try:
             video_stem = video_path.stem
-            spanish_path = (
-                Path(self.transcription_path)
-                / "es"
-                / course_name
-                / f"{video_stem}_{self.model_name}.txt"
-            )
-            autodetect_path = (
-                Path(self.transcription_path)
-                / "ad"
-                / course_name
-                / f"{video_stem}_{self.model_name}.txt"
+            spanish_path, autodetect_path = self.get_output_paths(
+                video_stem, course_name
             )
             spanish_path.parent.mkdir(parents=True, exist_ok=True)
             autodetect_path.parent.mkdir(parents=True, exist_ok=True)
@@ -51,30 +258,29 @@ class Transcriber:
                 logging.info(f"Video file not found: {video_path}")
                 return
 
-            if not spanish_path.exists():
+            if self.single_pass or audio is not None:
+                self.transcribe_single_pass(
+                    video_path, spanish_path, autodetect_path, audio
+                )
+                return
+
+            if not transcript_exists(spanish_path):
                 logging.info(
                     f"Generating Spanish transcription for {video_stem} using model {self.model_name}."
                 )
                 result = self.model.transcribe(str(video_path), language="es")
-
-                with open(spanish_path, "w") as f:
-                    f.write(result["text"])
-
-                logging.info(f"Transcription saved to {spanish_path}")
+                self.write_transcription(spanish_path, result)
             else:
                 logging.info(
                     f"Spanish transcription already exist for {video_stem}, skipping..."
                 )
 
-            if not autodetect_path.exists():
+            if not transcript_exists(autodetect_path):
                 logging.info(
                     f"Generating Auto-detected transcription for {video_stem} using model {self.model_name}."
                 )
                 result = self.model.transcribe(str(video_path))
-
-                with open(autodetect_path, "w") as f:
-                    f.write(result["text"])
-                logging.info(f"Transcription saved to {autodetect_path}")
+                self.write_transcription(autodetect_path, result)
             else:
                 logging.info(
                     f"Auto-detected transcription already exist for {video_stem}, skipping..."
@@ -82,3 +288,66 @@ class Transcriber:
 
         except Exception as e:
             logging.info(f"Failed to transcribe {video_path}: {str(e)}")
+
+    def transcribe_single_pass(
+        self, video_path, spanish_path, autodetect_path, audio=None
+    ):
+        """
+        Decode the video once and reuse the audio for both outputs.
+        When the detected language is Spanish the auto-detected transcription is
+        identical to the Spanish one, so the second inference pass is skipped.
+        """
+        video_stem = video_path.stem
+        if transcript_exists(spanish_path) and transcript_exists(autodetect_path):
+            logging.info(
+                f"Transcriptions already exist for {video_stem}, skipping..."
+            )
+            return
+
+        labels = self.get_labels(video_stem)
+        if audio is None:
+            with span("audio_decode", **labels):
+                audio = self.load_audio(video_path)
+        timeline = None
+        if self.vad is not None:
+            with span("vad", **labels):
+                audio, timeline = self.vad.remove_silence(audio)
+        audio_seconds = len(audio) / SAMPLE_RATE
+        language = None
+        if not transcript_exists(autodetect_path):
+            with span("language_detection", **labels):
+                language = self.detect_language(audio)
+            logging.info(f"Detected language for {video_stem}: {language}")
+
+        spanish_result = None
+        if not transcript_exists(spanish_path):
+            logging.info(
+                f"Generating Spanish transcription for {video_stem} using model {self.model_name}."
+            )
+            with span("inference", language="es", audio_seconds=audio_seconds, **labels):
+                spanish_result = self.transcribe_audio(
+                    audio, timeline, self.get_checkpoint_path(spanish_path), language="es"
+                )
+            self.write_transcription(spanish_path, spanish_result)
+
+        if language is None:
+            return
+
+        if language == "es":
+            logging.info(
+                f"Reusing Spanish transcription as auto-detected output for {video_stem}."
+            )
+            if spanish_result is not None:
+                self.write_transcription(autodetect_path, spanish_result)
+            else:
+                self.copy_transcription(spanish_path, autodetect_path)
+            return
+
+        logging.info(
+            f"Generating Auto-detected transcription for {video_stem} using model {self.model_name}."
+        )
+        with span("inference", language=language, audio_seconds=audio_seconds, **labels):
+            result = self.transcribe_audio(
+                audio, timeline, self.get_checkpoint_path(autodetect_path), language=language
+            )
+        self.write_transcription(autodetect_path, result)
@@ -0,0 +1,189 @@
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"TSC1"
+SUFFIX = ".seg"
+ALIGNMENT = 8
+
+# per-segment numeric columns, stored as little-endian arrays
+SEGMENT_COLUMNS = {
+    "seek": "<i4",
+    "start": "<f4",
+    "end": "<f4",
+    "temperature": "<f4",
+    "avg_logprob": "<f4",
+    "compression_ratio": "<f4",
+    "no_speech_prob": "<f4",
+}
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_transcript(path, result, **meta):
+    """
+    Write a whisper result as a single columnar .seg file: a JSON header followed by
+    aligned column arrays (segment times and confidences, flattened tokens and
+    UTF-8 text with offset arrays). A result without segments is stored as one
+    segment with unknown (NaN) times.
+    """
+    segments = result.get("segments") or []
+    if not segments and result.get("text"):
+        segments = [{"text": result["text"]}]
+
+    columns = {
+        name: np.array(
+            [segment.get(name, 0 if dtype == "<i4" else np.nan) for segment in segments],
+            dtype=dtype,
+        )
+        for name, dtype in SEGMENT_COLUMNS.items()
+    }
+    tokens = [segment.get("tokens", []) for segment in segments]
+    texts = [segment["text"].encode("utf-8") for segment in segments]
+    columns["token_offsets"] = np.cumsum([0] + [len(t) for t in tokens], dtype="<i8")
+    columns["tokens"] = np.array([t for ts in tokens for t in ts], dtype="<i4")
+    columns["text_offsets"] = np.cumsum([0] + [len(t) for t in texts], dtype="<i8")
+    columns["text"] = np.frombuffer(b"".join(texts), dtype=np.uint8)
+
+    layout = {}
+    offset = 0
+    for name, array in columns.items():
+        layout[name] = [array.dtype.str, offset, len(array)]
+        offset = align(offset + array.nbytes)
+    header = json.dumps(
+        {
+            "segments": len(segments),
+            "meta": {"language": result.get("language"), **meta},
+            "columns": layout,
+        }
+    ).encode("utf-8")
+
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        data_start = align(8 + len(header))
+        for name, array in columns.items():
+            f.seek(data_start + layout[name][1])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+class Transcript:
+    """Read-only, memory-mapped view of a .seg file. Columns are numpy views, nothing is copied."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        raw = np.memmap(self.path, dtype=np.uint8, mode="r")
+        if bytes(raw[:4]) != MAGIC:
+            raise ValueError(f"{path} is not a transcript store file")
+        header_length = int(raw[4:8].view("<u4")[0])
+        header = json.loads(bytes(raw[8 : 8 + header_length]))
+        data_start = align(8 + header_length)
+
+        self.meta = header["meta"]
+        self.columns = {}
+        for name, (dtype, offset, count) in header["columns"].items():
+            dtype = np.dtype(dtype)
+            start = data_start + offset
+            self.columns[name] = raw[start : start + count * dtype.itemsize].view(dtype)
+
+    def __len__(self):
+        return len(self.columns["start"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def text(self):
+        return bytes(self.columns["text"]).decode("utf-8")
+
+    def segment_text(self, i):
+        offsets = self.columns["text_offsets"]
+        return bytes(self.columns["text"][offsets[i] : offsets[i + 1]]).decode("utf-8")
+
+    def segment_tokens(self, i):
+        offsets = self.columns["token_offsets"]
+        return self.columns["tokens"][offsets[i] : offsets[i + 1]]
+
+    def segments(self):
+        """Yield the segments as whisper-style dicts."""
+        for i in range(len(self)):
+            segment = {"id": i, "text": self.segment_text(i), "tokens": self.segment_tokens(i).tolist()}
+            for name in SEGMENT_COLUMNS:
+                segment[name] = self.columns[name][i].item()
+            yield segment
+
+
+def transcript_exists(path):
+    """True if the transcription exists as a .seg file or in the legacy .txt layout."""
+    path = Path(path)
+    return path.with_suffix(SUFFIX).exists() or path.with_suffix(".txt").exists()
+
+
+def read_text(path):
+    """Return the plain text of a transcription stored either as .seg or as .txt."""
+    path = Path(path)
+    if path.with_suffix(SUFFIX).exists():
+        return Transcript(path.with_suffix(SUFFIX)).text
+    with open(path.with_suffix(".txt"), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def convert_legacy(transcriptions_path="../DB/Transcripciones/", remove=False):
+    """Convert every <stem>_<model>.txt (and its .json, if any) under {ad,es} into a .seg file."""
+    converted = 0
+    for language in ["ad", "es"]:
+        for txt_path in sorted((Path(transcriptions_path) / language).glob("*/*_*.txt")):
+            seg_path = txt_path.with_suffix(SUFFIX)
+            json_path = txt_path.with_suffix(".json")
+            if seg_path.exists():
+                continue
+            if json_path.exists():
+                with open(json_path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            else:
+                with open(txt_path, "r", encoding="utf-8") as f:
+                    result = {"text": f.read()}
+            model = txt_path.stem.rsplit("_", 1)[1]
+            write_transcript(seg_path, result, model=model)
+            converted += 1
+            if remove:
+                txt_path.unlink()
+                json_path.unlink(missing_ok=True)
+    logging.info(f"Converted {converted} transcriptions to {SUFFIX}")
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar transcript store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="convert .txt/.json transcriptions")
+    convert_parser.add_argument("--path", default="../DB/Transcripciones/")
+    convert_parser.add_argument("--remove", action="store_true", help="delete the converted files")
+    text_parser = subparsers.add_parser("text", help="print the text of a transcription")
+    text_parser.add_argument("file")
+    text_parser.add_argument("--segments", action="store_true", help="one timestamped line per segment")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_legacy(args.path, args.remove)
+    elif args.segments:
+        for segment in Transcript(args.file).segments():
+            print(f"[{segment['start']:8.2f} - {segment['end']:8.2f}]{segment['text']}")
+    else:
+        print(read_text(args.file))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    main()
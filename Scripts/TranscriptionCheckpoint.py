@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+# characters of already transcribed text passed as prompt after a resume,
+# whisper keeps at most the last 223 tokens of it
+PROMPT_CHARS = 800
+
+
+class TranscriptionCheckpoint:
+    """
+    Append-only sidecar that holds the progress of one transcription: a header
+    line with the decoding options, then one line per transcribed window with
+    its segments and the seek (in seconds) where decoding continues. Lines are
+    flushed and fsynced as they are written, and a torn last line left by a
+    killed job is ignored on load, so a restart loses at most one window.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.segments = []
+        self.seek = 0.0
+
+    def load(self, options):
+        """Restore the saved progress if it was made with the same options. Returns the seek."""
+        self.segments = []
+        self.seek = 0.0
+        if not self.path.exists():
+            return self.seek
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, json.JSONDecodeError):
+            header = None
+        if header != {"options": options}:
+            logging.info(f"Discarding checkpoint {self.path}, made with different options")
+            self.remove()
+            return self.seek
+        for i, line in enumerate(lines[1:], 1):
+            try:
+                window = json.loads(line)
+            except json.JSONDecodeError:
+                # drop the torn line so the next windows are appended after valid data
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(lines[:i]) + "\n")
+                break
+            self.segments.extend(window["segments"])
+            self.seek = window["seek"]
+        if self.seek:
+            logging.info(f"Resuming from {self.seek:.1f} s with {len(self.segments)} segments ({self.path})")
+        return self.seek
+
+    def start(self, options):
+        if self.path.exists():
+            return
+        self.write_line({"options": options})
+
+    def append(self, segments, seek):
+        self.segments.extend(segments)
+        self.seek = seek
+        self.write_line({"seek": seek, "segments": segments})
+
+    def write_line(self, data):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def get_prompt(self):
+        """The tail of the transcribed text, to condition the next window on."""
+        text = "".join(segment["text"] for segment in self.segments)
+        return text[-PROMPT_CHARS:] or None
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,134 @@
+import logging
+import multiprocessing
+import queue
+import threading
+from pathlib import Path
+
+# Whisper and CUDA don't survive fork, every worker starts a fresh interpreter
+CONTEXT = multiprocessing.get_context("spawn")
+# how often a producer blocked on a full queue checks that the workers are still alive
+PUT_TIMEOUT = 30
+
+
+def transcription_worker(jobs, transcriber_kwargs):
+    """Worker process loop: own a Transcriber and consume jobs until a None sentinel arrives."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    from Transcriber import Transcriber
+
+    transcriber = Transcriber(**transcriber_kwargs)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        video_path, course_name = job
+        try:
+            transcriber.transcribe_video(Path(video_path), course_name)
+        except Exception as e:
+            logging.info(f"Worker failed to transcribe {video_path}: {str(e)}")
+
+
+class TranscriptionPipeline:
+    """
+    Producer/consumer pipeline between the downloaders and Whisper.
+    Downloads enqueue finished videos through transcribe_video, which blocks
+    once max_pending jobs are waiting (backpressure), while num_workers
+    processes each hold their own model and transcribe in parallel. The workers
+    are only started by the first queued video. A worker that dies (OOM kill,
+    CUDA crash) is replaced up to max_restarts times, so a full queue never
+    blocks the downloaders on a process that is gone; the video it was
+    transcribing is left for the next run.
+    """
+
+    def __init__(self, num_workers=1, max_pending=2, max_restarts=3, **transcriber_kwargs):
+        self.num_workers = num_workers
+        self.max_restarts = max_restarts
+        self.transcriber_kwargs = transcriber_kwargs
+        self.jobs = CONTEXT.Queue(maxsize=max_pending)
+        self.workers = []
+        self.restarts = 0
+        self.lock = threading.Lock()
+
+    def start_worker(self):
+        # not daemonic: a ChunkedTranscriber starts its own pool of processes inside the
+        # worker. close() and terminate() stop the workers when the pipeline ends
+        worker = CONTEXT.Process(
+            target=transcription_worker,
+            args=(self.jobs, self.transcriber_kwargs),
+        )
+        worker.start()
+        return worker
+
+    def start(self):
+        for _ in range(self.num_workers):
+            self.workers.append(self.start_worker())
+        logging.info(f"Started {self.num_workers} transcription workers")
+
+    def restart_dead_workers(self):
+        """Replace the workers that died. Raises RuntimeError once max_restarts is used up."""
+        with self.lock:
+            for i, worker in enumerate(self.workers):
+                if worker.is_alive():
+                    continue
+                if self.restarts >= self.max_restarts:
+                    raise RuntimeError(
+                        f"Transcription worker died with exit code {worker.exitcode} "
+                        f"after {self.restarts} restarts"
+                    )
+                logging.info(
+                    f"Transcription worker {worker.pid} died with exit code {worker.exitcode}, restarting it"
+                )
+                self.restarts += 1
+                self.workers[i] = self.start_worker()
+
+    def put(self, job):
+        """Put job on the queue, checking every PUT_TIMEOUT seconds that someone still consumes it."""
+        while True:
+            try:
+                self.jobs.put(job, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                self.restart_dead_workers()
+
+    def transcribe_video(self, video_path, course_name):
+        """Queue a video for transcription, blocking while the queue is full."""
+        with self.lock:
+            if not self.workers:
+                self.start()
+        logging.info(f"Queueing {video_path} for transcription")
+        self.put((str(video_path), course_name))
+
+    def close(self):
+        """Wait for every queued job to finish and stop the workers."""
+        try:
+            for _ in self.workers:
+                self.put(None)
+        except RuntimeError as e:
+            logging.info(f"{str(e)}, leaving the queued videos for the next run")
+            self.terminate()
+            return
+        while self.workers:
+            worker = self.workers.pop()
+            worker.join()
+            if worker.exitcode == 0:
+                continue
+            # it died mid job without reading its sentinel, a replacement finishes the queue
+            logging.info(f"Transcription worker {worker.pid} died with exit code {worker.exitcode}")
+            if self.restarts < self.max_restarts:
+                self.restarts += 1
+                self.workers.append(self.start_worker())
+        logging.info("Transcription workers finished")
+
+    def terminate(self):
+        for worker in self.workers:
+            worker.terminate()
+            worker.join()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
@@ -1,10 +1,10 @@
 import requests
 import os
 from pathlib import Path
-import cv2
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from constants import BYTES_TO_GB
+from DownloadEngine import DownloadEngine
 
 class VideoDownloader:
     def __init__(self, logger, transcriber, base_url="https://open.fing.edu.uy/media/{course}/{course}_{nn}.mp4",
@@ -14,6 +14,7 @@ class VideoDownloader:
         self.base_url = base_url
         self.db_path = db_path
         self.total_max_size = total_max_size
+        self.download_engine = DownloadEngine()
 
     def get_folder_size(self, path):
         total_size = 0
@@ -25,35 +26,11 @@ class VideoDownloader:
 
     def download_video(self, url, path, expected_size):
         """Download or resume a video from a URL and save it to a specified path."""
-        try:
-            headers = {}
-            existing_file_size = 0
-
-            if path.exists():
-                existing_file_size = os.path.getsize(path)
-                if existing_file_size > 0:
-                    if existing_file_size < expected_size:
-                        headers = {'Range': f'bytes={existing_file_size}-'}
-                        self.logger.log_message(f"Resuming download for {path} at byte {existing_file_size}")
-                    else:
-                        self.logger.log_message(f"Existing file size {existing_file_size / BYTES_TO_GB:.2f} GB is greater than or equal to expected {expected_size / BYTES_TO_GB:.2f} GB. Redownloading...")
-                        os.remove(path)
-
-            response = requests.get(url, stream=True, headers=headers)
-            if response.status_code in [200, 206]:
-                with open(path, 'ab' if existing_file_size > 0 else 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                actual_size = os.path.getsize(path)
-                return actual_size
-            else:
-                self.logger.log_message(f"Failed to download {url}. Status code: {response.status_code}")
-                return 0
-        except requests.RequestException as e:
-            self.logger.log_message(f"Failed to download {url}: {str(e)}")
-            return 0
+        return self.download_engine.download(url, path, expected_size)
 
     def is_download_complete(self, file_path):
+        import cv2
+
         try:
             cap = cv2.VideoCapture(file_path)
             if not cap.isOpened():
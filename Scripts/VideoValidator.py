@@ -0,0 +1,80 @@
+import logging
+import struct
+from pathlib import Path
+
+from Catalog import Catalog
+from constants import BYTES_TO_GB
+
+REQUIRED_BOXES = {b"ftyp", b"moov", b"mdat"}
+
+
+class VideoValidator:
+    """
+    Validate downloaded mp4 files by walking their top-level box structure instead
+    of decoding a frame. Every box must fit inside the file, so a truncated
+    download is caught even when its first frames are intact. Verdicts are cached
+    in the catalog by (path, size, mtime), so re-runs don't touch the file at all.
+    """
+
+    def __init__(self, catalog: Catalog = None):
+        self.catalog = catalog or Catalog()
+
+    def get_key(self, video_path):
+        return Path(video_path).resolve().as_posix()
+
+    def check_boxes(self, video_path):
+        """Return None if the mp4 box structure is complete, otherwise the reason it isn't."""
+        file_size = Path(video_path).stat().st_size
+        if file_size == 0:
+            return "empty file"
+
+        box_types = []
+        offset = 0
+        with open(video_path, "rb") as f:
+            while offset < file_size:
+                f.seek(offset)
+                header = f.read(8)
+                if len(header) < 8:
+                    return f"truncated box header at byte {offset}"
+                box_size, box_type = struct.unpack(">I4s", header)
+                if box_size == 1:
+                    large_size = f.read(8)
+                    if len(large_size) < 8:
+                        return f"truncated box header at byte {offset}"
+                    box_size = struct.unpack(">Q", large_size)[0]
+                elif box_size == 0:
+                    box_size = file_size - offset
+                if box_size < 8:
+                    return f"invalid size {box_size} for box {box_type!r} at byte {offset}"
+                if offset + box_size > file_size:
+                    return f"box {box_type!r} ends at byte {offset + box_size} but the file has {file_size} bytes"
+                box_types.append(box_type)
+                offset += box_size
+
+        if box_types[0] != b"ftyp":
+            return f"first box is {box_types[0]!r}, expected b'ftyp'"
+        missing = REQUIRED_BOXES - set(box_types)
+        if missing:
+            return f"missing boxes {sorted(missing)}"
+        return None
+
+    def validate(self, video_path, expected_size=None):
+        """Check size and container structure of video_path, reusing a cached verdict if any."""
+        stat = Path(video_path).stat()
+        key = self.get_key(video_path)
+
+        verdict = self.catalog.get_verdict(key, stat.st_size, stat.st_mtime_ns)
+        if verdict is not None:
+            valid, reason = verdict
+        else:
+            reason = self.check_boxes(video_path)
+            valid = reason is None
+            self.catalog.set_verdict(key, stat.st_size, stat.st_mtime_ns, valid, reason)
+
+        if valid and expected_size is not None and stat.st_size != expected_size:
+            valid = False
+            reason = f"size mismatch: expected {expected_size / BYTES_TO_GB:.2f} GB, got {stat.st_size / BYTES_TO_GB:.2f} GB"
+
+        if not valid:
+            logging.info(f"File {video_path} failed validation: {reason}")
+        return valid
@@ -0,0 +1,109 @@
+import logging
+from bisect import bisect_right
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+class SpeechTimeline:
+    """Map times in the silence-stripped audio back to times in the original video."""
+
+    def __init__(self, regions):
+        self.compact_starts = []
+        self.original_starts = []
+        compact_start = 0
+        for start, end in regions:
+            self.compact_starts.append(compact_start / SAMPLE_RATE)
+            self.original_starts.append(start / SAMPLE_RATE)
+            compact_start += end - start
+
+    def to_original(self, t):
+        i = max(bisect_right(self.compact_starts, t) - 1, 0)
+        return self.original_starts[i] + (t - self.compact_starts[i])
+
+    def remap(self, result):
+        """Rewrite segment (and word) timestamps of a whisper result in place."""
+        for segment in result["segments"]:
+            segment["start"] = self.to_original(segment["start"])
+            segment["end"] = self.to_original(segment["end"])
+            for word in segment.get("words", []):
+                word["start"] = self.to_original(word["start"])
+                word["end"] = self.to_original(word["end"])
+        return result
+
+
+class VoiceActivityDetector:
+    """
+    Energy-based voice activity detection on 16 kHz PCM. Frames louder than the
+    noise floor (a low percentile of the frame energies) by threshold_db are
+    speech. Pauses shorter than min_silence_seconds are kept, so only long
+    stretches of silence (breaks, board writing) are removed before inference.
+    """
+
+    def __init__(
+        self,
+        frame_seconds=0.03,
+        threshold_db=12.0,
+        noise_percentile=10,
+        min_silence_seconds=2.0,
+        min_speech_seconds=0.25,
+        padding_seconds=0.4,
+    ):
+        self.frame_size = int(frame_seconds * SAMPLE_RATE)
+        self.threshold_db = threshold_db
+        self.noise_percentile = noise_percentile
+        self.min_silence_frames = int(min_silence_seconds / frame_seconds)
+        self.min_speech_frames = max(int(min_speech_seconds / frame_seconds), 1)
+        self.padding = int(padding_seconds * SAMPLE_RATE)
+
+    def get_frame_energy(self, audio):
+        """Energy in dB of every frame. einsum avoids materializing audio ** 2 for long lectures."""
+        n_frames = len(audio) // self.frame_size
+        frames = np.asarray(audio[: n_frames * self.frame_size]).reshape(n_frames, self.frame_size)
+        power = np.einsum("ij,ij->i", frames, frames) / self.frame_size
+        return 10 * np.log10(power + 1e-10)
+
+    def get_speech_regions(self, audio):
+        """Return the (start, end) sample ranges that contain speech."""
+        energy = self.get_frame_energy(audio)
+        if len(energy) == 0:
+            return []
+        threshold = np.percentile(energy, self.noise_percentile) + self.threshold_db
+        is_speech = np.concatenate([[False], energy > threshold, [False]])
+        edges = np.flatnonzero(np.diff(is_speech.astype(np.int8)))
+        runs = edges.reshape(-1, 2)
+
+        regions = []
+        for start, end in runs:
+            if regions and start - regions[-1][1] < self.min_silence_frames:
+                regions[-1][1] = end
+            else:
+                regions.append([start, end])
+
+        samples = []
+        for start, end in regions:
+            if end - start < self.min_speech_frames:
+                continue
+            start = max(int(start) * self.frame_size - self.padding, 0)
+            end = min(int(end) * self.frame_size + self.padding, len(audio))
+            if samples and start <= samples[-1][1]:
+                samples[-1] = (samples[-1][0], end)
+            else:
+                samples.append((start, end))
+        return samples
+
+    def remove_silence(self, audio):
+        """
+        Return the audio with non-speech regions dropped, plus the SpeechTimeline to map
+        timestamps back. If no speech is found the audio is returned untouched with None.
+        """
+        regions = self.get_speech_regions(audio)
+        if not regions:
+            return audio, None
+        speech = np.concatenate([audio[start:end] for start, end in regions])
+        logging.info(
+            f"Voice activity detection kept {len(speech) / SAMPLE_RATE / 60:.1f} of "
+            f"{len(audio) / SAMPLE_RATE / 60:.1f} minutes in {len(regions)} regions"
+        )
+        return speech, SpeechTimeline(regions)
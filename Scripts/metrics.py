@@ -1,18 +1,34 @@
+import json
 import logging
+import math
+import os
 import pathlib
+import re
+from concurrent.futures import ProcessPoolExecutor
 
 import jiwer as ji
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
+from TranscriptStore import SUFFIX, Transcript, read_text, transcript_exists
 
+RESULTS_COLUMNS = [
+    "model",
+    "language",
+    "course",
+    "subject",
+    "wer",
+    "wil",
+    "reference_words",
+    "hypothesis_words",
+    "reference_mtime_ns",
+    "hypothesis_mtime_ns",
+]
 
-def calculate_metrics(real_path, asr_path):
-    with open(real_path, "r") as f:
-        human = f.read()
 
-    with open(asr_path, "r") as f:
-        asr = f.read()
+def calculate_metrics(real_path, asr_path):
+    human = read_text(real_path)
+    asr = read_text(asr_path)
 
     wer = ji.wer(human, asr)
     wil = ji.wil(human, asr)
@@ -37,18 +53,368 @@ def compare_models(subject_paths, transcriptions_path="../DB/Transcripciones"):
                 if not real_path.exists():
                     logging.info(f"File {real_path} not found. Skipping...")
                     continue
-                if not asr_path.exists():
+                if not transcript_exists(asr_path):
                     logging.info(f"File {asr_path} not found. Skipping...")
                     continue
 
                 metrics = calculate_metrics(real_path, asr_path)
-                data[model][subject][language] = metrics
+                data.setdefault(model, {}).setdefault(subject, {})[language] = metrics
 
     return data
 
 
+def normalize_text(text):
+    """Lowercase and strip punctuation so WER only counts word differences."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def read_normalized(path):
+    if path.suffix == SUFFIX:
+        return normalize_text(Transcript(path).text)
+    with open(path, "r", encoding="utf-8") as f:
+        return normalize_text(f.read())
+
+
+def find_evaluation_pairs(transcriptions_path="../DB/Transcripciones"):
+    """
+    Walk transcriptions_path/{ad,es} and pair every model transcription with its
+    human reference in manuales/<course>/<stem>.txt.
+    Returns {reference_path: [(model, language, course, subject, hypothesis_path), ...]}.
+    """
+    transcriptions_path = pathlib.Path(transcriptions_path)
+    references = {
+        (path.parent.name, path.stem): path
+        for path in (transcriptions_path / "manuales").glob("*/*.txt")
+    }
+    pairs = {}
+    for language in ["ad", "es"]:
+        for path in (transcriptions_path / language).glob("*/*_*.*"):
+            if path.suffix not in (".txt", SUFFIX):
+                continue
+            # the .seg file supersedes a legacy .txt of the same transcription
+            if path.suffix == ".txt" and path.with_suffix(SUFFIX).exists():
+                continue
+            subject, model = path.stem.rsplit("_", 1)
+            reference_path = references.get((path.parent.name, subject))
+            if reference_path is None:
+                continue
+            pairs.setdefault(reference_path, []).append(
+                (model, language, path.parent.name, subject, path)
+            )
+    return pairs
+
+
+def evaluate_reference(reference, hypotheses):
+    """Score every hypothesis of one reference. Runs in a worker process."""
+    rows = []
+    reference_words = len(reference.split())
+    for model, language, course, subject, path in hypotheses:
+        hypothesis = read_normalized(path)
+        output = ji.process_words(reference, hypothesis)
+        rows.append(
+            {
+                "model": model,
+                "language": language,
+                "course": course,
+                "subject": subject,
+                "wer": output.wer,
+                "wil": output.wil,
+                "reference_words": reference_words,
+                "hypothesis_words": len(hypothesis.split()),
+                "hypothesis_mtime_ns": path.stat().st_mtime_ns,
+            }
+        )
+    return rows
+
+
+def evaluate_corpus(
+    transcriptions_path="../DB/Transcripciones",
+    results_path="../DB/Metrics/results.csv",
+    max_workers=None,
+):
+    """
+    Compute WER/WIL for every (model, language, subject) with a human reference and
+    store them as a tidy table in results_path. Pairs whose reference and
+    transcription haven't changed since the last run are reused from the table;
+    each reference is normalized once and scored against all its transcriptions
+    in the same worker process.
+    """
+    results_path = pathlib.Path(results_path)
+    previous = (
+        pd.read_csv(results_path)
+        if results_path.exists()
+        else pd.DataFrame(columns=RESULTS_COLUMNS)
+    )
+    previous_rows = {
+        (row.model, row.language, row.course, row.subject): row._asdict()
+        for row in previous.itertuples(index=False)
+    }
+
+    kept, tasks = [], []
+    for reference_path, hypotheses in find_evaluation_pairs(transcriptions_path).items():
+        reference_mtime = reference_path.stat().st_mtime_ns
+        pending = []
+        for hypothesis in hypotheses:
+            model, language, course, subject, path = hypothesis
+            row = previous_rows.get((model, language, course, subject))
+            if (
+                row is not None
+                and row["reference_mtime_ns"] == reference_mtime
+                and row["hypothesis_mtime_ns"] == path.stat().st_mtime_ns
+            ):
+                kept.append(row)
+            else:
+                pending.append(hypothesis)
+        if pending:
+            tasks.append((reference_path, reference_mtime, pending))
+
+    logging.info(
+        f"Evaluating {sum(len(t[2]) for t in tasks)} transcriptions, {len(kept)} unchanged since the last run"
+    )
+    rows = list(kept)
+    if tasks:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            futures = [
+                (executor.submit(evaluate_reference, read_normalized(path), pending), mtime)
+                for path, mtime, pending in tasks
+            ]
+            for future, reference_mtime in futures:
+                for row in future.result():
+                    row["reference_mtime_ns"] = reference_mtime
+                    rows.append(row)
+
+    results = pd.DataFrame(rows, columns=RESULTS_COLUMNS).sort_values(
+        ["course", "subject", "language", "model"], ignore_index=True
+    )
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(results_path, index=False)
+    logging.info(f"Evaluation results saved to {results_path}")
+    return results
+
+
+SRT_TIME = re.compile(r"(\d+):(\d+):(\d+)[,.](\d+)\s*-->\s*(\d+):(\d+):(\d+)[,.](\d+)")
+
+WINDOW_COLUMNS = [
+    "window_start",
+    "window_end",
+    "reference_words",
+    "hypothesis_words",
+    "hits",
+    "substitutions",
+    "deletions",
+    "insertions",
+    "wer",
+]
+
+
+def parse_srt(path):
+    """Return the (start, end, text) cues of an .srt file, times in seconds."""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        blocks = f.read().replace("\r\n", "\n").split("\n\n")
+    cues = []
+    for block in blocks:
+        lines = block.strip().split("\n")
+        for i, line in enumerate(lines):
+            match = SRT_TIME.search(line)
+            if match:
+                h1, m1, s1, ms1, h2, m2, s2, ms2 = (int(g) for g in match.groups())
+                cues.append(
+                    (
+                        h1 * 3600 + m1 * 60 + s1 + ms1 / 1000,
+                        h2 * 3600 + m2 * 60 + s2 + ms2 / 1000,
+                        " ".join(lines[i + 1 :]),
+                    )
+                )
+                break
+    return cues
+
+
+def read_segments(path):
+    """Return the (start, end, text) segments of a whisper .json result or a .seg transcript."""
+    path = pathlib.Path(path)
+    if path.suffix == SUFFIX:
+        transcript = Transcript(path)
+        return [
+            (float(start), float(end), transcript.segment_text(i))
+            for i, (start, end) in enumerate(zip(transcript["start"], transcript["end"]))
+        ]
+    with open(path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    return [(segment["start"], segment["end"], segment["text"]) for segment in result["segments"]]
+
+
+def timed_words(segments):
+    """
+    Return the (time, word) normalized words of the segments. A segment's words are
+    spread evenly over its interval, as the transcripts only have segment times.
+    """
+    words = []
+    for start, end, text in segments:
+        segment_words = normalize_text(text).split()
+        if not segment_words or math.isnan(start):
+            continue
+        step = max(end - start, 0) / len(segment_words)
+        words.extend((start + (i + 0.5) * step, word) for i, word in enumerate(segment_words))
+    return words
+
+
+def align_window(reference, context, hypothesis, window_end):
+    """
+    Align the reference words of a window, followed by the context of the next
+    window's words within the margin, with the hypothesis words that follow the
+    ones already used, up to window_end plus the margin. The window keeps what is
+    aligned to its own reference words, and the insertions before the context that
+    are still before window_end; the hypothesis words aligned to the context are
+    left for the next window. Returns the counts and how many hypothesis words were
+    used, always a prefix of hypothesis.
+    """
+    counts = dict.fromkeys(WINDOW_COLUMNS[2:-1], 0)
+    counts["reference_words"] = len(reference)
+    if not hypothesis or not reference + context:
+        counts["deletions"] = len(reference)
+        used = sum(1 for word_time, _ in hypothesis if word_time < window_end)
+        counts["hypothesis_words"] = counts["insertions"] = used
+        return counts, used
+
+    output = ji.process_words(
+        " ".join(word for _, word in reference + context),
+        " ".join(word for _, word in hypothesis),
+    )
+    own = len(reference)
+    columns = {"equal": "hits", "substitute": "substitutions", "delete": "deletions"}
+    used = 0
+    for chunk in output.alignments[0]:
+        if chunk.type == "insert":
+            if chunk.ref_start_idx < own:
+                inserted = chunk.hyp_end_idx - chunk.hyp_start_idx
+            elif chunk.ref_start_idx == own:
+                inserted = 0
+                while (
+                    chunk.hyp_start_idx + inserted < chunk.hyp_end_idx
+                    and hypothesis[chunk.hyp_start_idx + inserted][0] < window_end
+                ):
+                    inserted += 1
+            else:
+                break
+            counts["insertions"] += inserted
+            used = chunk.hyp_start_idx + inserted
+            continue
+        words = min(chunk.ref_end_idx, own) - chunk.ref_start_idx
+        if words <= 0:
+            break
+        counts[columns[chunk.type]] += words
+        if chunk.type != "delete":
+            used = chunk.hyp_start_idx + words
+    counts["hypothesis_words"] = used
+    return counts, used
+
+
+def evaluate_windows(reference_segments, hypothesis_segments, window_seconds=60, margin_seconds=10):
+    """
+    WER of every window_seconds window of a lecture. The reference words go to the
+    window of their time, and each window is aligned on its own with the hypothesis
+    words that are left, with margin_seconds of the next window on both sides, so a
+    word whose estimated time falls on different sides of a boundary in the
+    reference and the hypothesis still matches. Every hypothesis word is used by
+    exactly one window (see align_window), and alignment is only done inside a
+    window and its margin, so the cost grows linearly with the lecture length
+    instead of quadratically as when whole files are compared.
+    """
+    reference = timed_words(reference_segments)
+    hypothesis = timed_words(hypothesis_segments)
+    window_count = int(max((t for t, _ in reference + hypothesis), default=0) // window_seconds) + 1
+    reference_windows = [[] for _ in range(window_count)]
+    for word_time, word in reference:
+        reference_windows[int(word_time // window_seconds)].append((word_time, word))
+
+    rows = []
+    next_word = 0
+    for window, window_reference in enumerate(reference_windows):
+        # the last window uses every word left
+        last = window == window_count - 1
+        window_end = float("inf") if last else (window + 1) * window_seconds
+        context = []
+        for later in range(window + 1, window_count):
+            if later * window_seconds >= window_end + margin_seconds:
+                break
+            context += [w for w in reference_windows[later] if w[0] < window_end + margin_seconds]
+        candidates = []
+        while (
+            next_word + len(candidates) < len(hypothesis)
+            and hypothesis[next_word + len(candidates)][0] < window_end + margin_seconds
+        ):
+            candidates.append(hypothesis[next_word + len(candidates)])
+        counts, used = align_window(window_reference, context, candidates, window_end)
+        next_word += used
+        rows.append(
+            {
+                "window_start": window * window_seconds,
+                "window_end": (window + 1) * window_seconds,
+                **counts,
+                "wer": (counts["substitutions"] + counts["deletions"] + counts["insertions"])
+                / counts["reference_words"]
+                if counts["reference_words"]
+                else float("nan"),
+            }
+        )
+    return pd.DataFrame(rows, columns=WINDOW_COLUMNS)
+
+
+def aggregate_windows(windows):
+    """Corpus-level WER of a window table: total errors over total reference words."""
+    errors = windows[["substitutions", "deletions", "insertions"]].to_numpy().sum()
+    reference_words = windows["reference_words"].sum()
+    return {
+        "wer": errors / reference_words if reference_words else float("nan"),
+        "reference_words": int(reference_words),
+        "errors": int(errors),
+        "windows": len(windows),
+    }
+
+
+def evaluate_srt(
+    transcriptions_path="../DB/Transcripciones",
+    course="pln",
+    window_seconds=60,
+    results_path="../DB/Metrics/windows.csv",
+):
+    """
+    Evaluate every timestamped transcription (.seg or whisper .json) of course against
+    the human subtitles in transcriptions_path/<course>/<subject>.srt, window by
+    window. Saves the per-window table to results_path and returns it together with
+    the aggregate score of every (model, language, subject).
+    """
+    transcriptions_path = pathlib.Path(transcriptions_path)
+    tables, summary = [], []
+    for reference_path in sorted((transcriptions_path / course).glob("*.srt")):
+        reference = parse_srt(reference_path)
+        for language in ["ad", "es"]:
+            hypotheses = {}
+            for path in sorted((transcriptions_path / language / course).glob(f"{reference_path.stem}_*.*")):
+                if path.suffix in (".json", SUFFIX):
+                    # the .seg file supersedes a legacy .json of the same transcription
+                    hypotheses.setdefault(path.stem, path)
+                    if path.suffix == SUFFIX:
+                        hypotheses[path.stem] = path
+            for stem, path in hypotheses.items():
+                model = stem.rsplit("_", 1)[1]
+                windows = evaluate_windows(reference, read_segments(path), window_seconds)
+                labels = {"model": model, "language": language, "course": course, "subject": reference_path.stem}
+                tables.append(windows.assign(**labels))
+                summary.append({**labels, **aggregate_windows(windows)})
+                logging.info(f"{reference_path.stem} {model} ({language}): WER {summary[-1]['wer']:.3f}")
+
+    results = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    results_path = pathlib.Path(results_path)
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(results_path, index=False)
+    logging.info(f"Window evaluation saved to {results_path}")
+    return results, pd.DataFrame(summary)
+
+
 def plot(data):
     """
+    data is either the tidy table returned by evaluate_corpus or
     data = {
         "medium": {
             "subject1": {"wer": 0.2, "wil": 0.15},
@@ -63,6 +429,18 @@ def plot(data):
     """
     wer_data, wil_data = [], []
 
+    if isinstance(data, pd.DataFrame):
+        data = {
+            model: {
+                subject: {
+                    row.language: {"wer": row.wer, "wil": row.wil}
+                    for row in rows.itertuples()
+                }
+                for subject, rows in model_rows.groupby("subject")
+            }
+            for model, model_rows in data.groupby("model")
+        }
+
     for model, subjects in data.items():
         for subject, languages in subjects.items():
             for language, metrics in languages.items():
@@ -1,6 +1,7 @@
 #!/bin/bash
 #SBATCH --job-name=transcribe
 #SBATCH --ntasks=1
+#SBATCH --array=0-3
 #SBATCH --mem=4096
 #SBATCH --time=04:00:00
 #SBATCH --mail-type=ALL
@@ -12,9 +13,12 @@
 #SBATCH --qos=gpu
 
 #https://www.cluster.uy/ayuda/como_ejecutar/#trabajo-normal-con-gpu
+# Each array task is one shard (SLURM_ARRAY_TASK_ID of SLURM_ARRAY_TASK_COUNT),
+# change --array to use more or fewer GPUs.
 
 cd ~/ProyectoDeGrado/Scripts
 conda activate
-python Main.py
+# --time-limit matches --time, classes that would not finish in time are left for the next run
+python Main.py --time-limit 240
 
 
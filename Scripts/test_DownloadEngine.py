@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from DownloadEngine import DownloadEngine, parse_content_range
+
+SIZE = 4_000_000
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.data, honouring Range with at most server.max_bytes per response.
+    Range requests fail with 404 once server.fail_after of them were answered.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def send_data(self, head_only):
+        data = self.server.data
+        range_header = self.headers.get("Range")
+        if range_header is None:
+            self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if not head_only:
+                self.wfile.write(data)
+            return
+        if len(self.server.requests) >= self.server.fail_after:
+            self.send_error(404)
+            return
+        start, _, end = range_header.removeprefix("bytes=").partition("-")
+        start = int(start)
+        end = min(int(end) if end else len(data) - 1, len(data) - 1)
+        end = min(end, start + self.server.max_bytes - 1)
+        self.server.requests.append((start, end))
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(data[start : end + 1])
+
+    def do_HEAD(self):
+        self.send_data(True)
+
+    def do_GET(self):
+        self.send_data(False)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.data = os.urandom(SIZE)
+    server.max_bytes = SIZE
+    server.fail_after = float("inf")
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/video.mp4"
+
+
+def get_engine():
+    return DownloadEngine(
+        range_parts=4, min_range_size=1, chunk_size=64 * 1024, buffer_size=256 * 1024, timeout=10
+    )
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 0-99/1000") == (0, 99)
+    assert parse_content_range("bytes 5-9/*") == (5, 9)
+    assert parse_content_range(None) is None
+    assert parse_content_range("bytes */1000") is None
+
+
+def test_ranged_download(server, tmp_path):
+    engine = get_engine()
+    url = get_url(server)
+    assert engine.head(url) == SIZE
+    path = tmp_path / "video.mp4"
+    assert engine.download(url, path, SIZE) == SIZE
+    assert path.read_bytes() == server.data
+    assert len(server.requests) == 4
+    assert not path.with_name("video.mp4.ranges").exists()
+
+
+def test_ranged_download_with_short_responses(server, tmp_path):
+    server.max_bytes = 300_000
+    engine = get_engine()
+    url = get_url(server)
+    engine.head(url)
+    path = tmp_path / "video.mp4"
+    assert engine.download(url, path, SIZE) == SIZE
+    assert path.read_bytes() == server.data
+    assert len(server.requests) > 4
+
+
+def test_ranged_download_resumes(server, tmp_path):
+    server.max_bytes = 300_000
+    engine = get_engine()
+    url = get_url(server)
+    engine.head(url)
+    path = tmp_path / "video.mp4"
+
+    # let the first responses through, then fail every range request
+    server.fail_after = 6
+    assert engine.download(url, path, SIZE) == 0
+    assert not path.exists()
+    with open(path.with_name("video.mp4.ranges"), "r", encoding="utf-8") as f:
+        written = sum(r["written"] for r in json.load(f)["ranges"])
+    assert 0 < written < SIZE
+
+    server.fail_after = float("inf")
+    server.requests = []
+    assert engine.download(url, path, SIZE) == SIZE
+    assert path.read_bytes() == server.data
+    assert sum(end - start + 1 for start, end in server.requests) == SIZE - written
+
+
+def test_incomplete_ranges_are_not_renamed(server, tmp_path):
+    engine = get_engine()
+    url = get_url(server)
+    engine.head(url)
+    path = tmp_path / "video.mp4"
+    server.fail_after = 0
+    assert engine.download(url, path, SIZE) == 0
+    assert not path.exists()
+    assert path.with_name("video.mp4.part").stat().st_size == SIZE
+
+
+def test_stream_download_resumes(server, tmp_path):
+    engine = DownloadEngine(range_parts=1, timeout=10)
+    url = get_url(server)
+    path = tmp_path / "video.mp4"
+    path.write_bytes(server.data[:1_000_000])
+    assert engine.download(url, path, SIZE) == SIZE
+    assert path.read_bytes() == server.data
+    assert server.requests == [(1_000_000, SIZE - 1)]
+
+
+def test_get_bytes_with_short_responses(server):
+    server.max_bytes = 300_000
+    engine = get_engine()
+    content = engine.get_bytes(get_url(server), 100, 1_000_099)
+    assert content == server.data[100:1_000_100]
+    assert len(server.requests) == 4
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+
+import pytest
+from Sharding import ClassClaims
+
+LEASE_SECONDS = 60
+KEY = "pln_01"
+
+
+@pytest.fixture
+def claims_path(tmp_path):
+    return tmp_path / "Claims"
+
+
+def get_claims(claims_path, owner):
+    claims = ClassClaims(claims_path, owner=owner, lease_seconds=LEASE_SECONDS)
+    # no heartbeat, the tests age the claim files themselves
+    claims.stop.set()
+    return claims
+
+
+def expire(claims, key=KEY):
+    past = time.time() - 2 * LEASE_SECONDS
+    os.utime(claims.get_path(key), (past, past))
+
+
+def test_live_claim_is_not_taken_over(claims_path):
+    first = get_claims(claims_path, "node1:1")
+    second = get_claims(claims_path, "node2:2")
+    assert first.claim(KEY)
+    assert not second.claim(KEY)
+    assert first.is_owner(KEY)
+
+
+def test_expired_claim_is_taken_over(claims_path):
+    first = get_claims(claims_path, "node1:1")
+    second = get_claims(claims_path, "node2:2")
+    assert first.claim(KEY)
+    expire(first)
+    assert second.claim(KEY)
+    assert second.is_owner(KEY)
+    # the previous owner lost it, and its release leaves the new claim alone
+    assert not first.is_owner(KEY)
+    first.release(KEY)
+    assert second.is_owner(KEY)
+    assert not claims_path.joinpath(f"{KEY}.claim.lock").exists()
+
+
+def test_claim_refreshed_during_takeover_is_kept(claims_path):
+    first = get_claims(claims_path, "node1:1")
+    assert first.claim(KEY)
+    expire(first)
+
+    class RefreshedMeanwhile(ClassClaims):
+        looks = 0
+
+        def get_owner(self, path):
+            claim = super().get_owner(path)
+            self.looks += 1
+            if self.looks == 1:
+                # the owner's heartbeat runs between the first look and the lock
+                os.utime(path)
+            return claim
+
+    second = RefreshedMeanwhile(claims_path, owner="node2:2", lease_seconds=LEASE_SECONDS)
+    second.stop.set()
+    assert not second.claim(KEY)
+    assert first.is_owner(KEY)
+
+
+def test_concurrent_takeovers_have_one_winner(claims_path):
+    first = get_claims(claims_path, "node1:1")
+    assert first.claim(KEY)
+    expire(first)
+
+    takers = [get_claims(claims_path, f"node{i}:{i}") for i in range(2, 10)]
+    barrier = threading.Barrier(len(takers))
+    won = {}
+
+    def take(claims):
+        barrier.wait()
+        won[claims.owner] = claims.claim(KEY)
+
+    threads = [threading.Thread(target=take, args=(claims,)) for claims in takers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = [owner for owner, ok in won.items() if ok]
+    assert len(winners) == 1
+    assert takers[0].get_owner(takers[0].get_path(KEY))[0] == winners[0]
+
+
+def test_stale_takeover_lock_is_cleared(claims_path):
+    first = get_claims(claims_path, "node1:1")
+    second = get_claims(claims_path, "node2:2")
+    assert first.claim(KEY)
+    expire(first)
+    # a taker killed while holding the lock
+    lock_path = claims_path / f"{KEY}.claim.lock"
+    lock_path.touch()
+    past = time.time() - 2 * LEASE_SECONDS
+    os.utime(lock_path, (past, past))
+    assert not second.claim(KEY)
+    assert not lock_path.exists()
+    assert second.claim(KEY)
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from Transcriber import Transcriber, split_window
+from VoiceActivity import SAMPLE_RATE
+
+SECONDS = 200
+
+
+class FakeModel:
+    """
+    Hears the word w<n> from n + 0.2 to n + 0.8 s of the lecture, and groups the
+    words of every segment_words seconds in one segment. Every sample holds its
+    second, so the model knows where a window starts. Fails once max_calls is reached.
+    """
+
+    def __init__(self, segment_words=7, max_calls=None):
+        self.segment_words = segment_words
+        self.max_calls = max_calls
+        self.calls = 0
+
+    def transcribe(self, audio, language=None, initial_prompt=None, **options):
+        if self.max_calls is not None and self.calls >= self.max_calls:
+            raise RuntimeError("killed")
+        self.calls += 1
+        seconds = np.round(audio * 1000).astype(int)
+        changes = np.flatnonzero(seconds != seconds[0])
+        start = seconds[0] + 1 - (changes[0] if len(changes) else len(seconds)) / SAMPLE_RATE
+        duration = len(audio) / SAMPLE_RATE
+        groups = {}
+        for word in range(int(start), int(start + duration) + 1):
+            if word + 0.2 >= start and word + 0.8 <= start + duration:
+                groups.setdefault(word // self.segment_words, []).append(word)
+        return {
+            "language": language,
+            "segments": [
+                {
+                    "seek": 0,
+                    "start": words[0] + 0.2 - start,
+                    "end": words[-1] + 0.8 - start,
+                    "text": "".join(f" w{word}" for word in words),
+                }
+                for words in groups.values()
+            ],
+        }
+
+
+def lecture():
+    return (np.repeat(np.arange(SECONDS), SAMPLE_RATE) / 1000).astype(np.float32)
+
+
+def get_words(result):
+    return [int(word[1:]) for word in result["text"].split()]
+
+
+def get_transcriber(model):
+    transcriber = Transcriber(checkpoint_seconds=30)
+    transcriber._model = model
+    return transcriber
+
+
+@pytest.mark.parametrize("segment_words", [7, 1000])
+def test_windows_are_stitched_without_gaps_or_repeats(tmp_path, segment_words):
+    transcriber = get_transcriber(FakeModel(segment_words))
+    result = transcriber.transcribe_with_checkpoints(
+        lecture(), tmp_path / "pln_01_tiny.partial.jsonl", language="es"
+    )
+    assert get_words(result) == list(range(SECONDS))
+    starts = [segment["start"] for segment in result["segments"]]
+    assert starts == sorted(starts)
+    assert [segment["id"] for segment in result["segments"]] == list(range(len(starts)))
+
+
+def test_killed_transcription_resumes_from_checkpoint(tmp_path):
+    uninterrupted = FakeModel()
+    get_transcriber(uninterrupted).transcribe_with_checkpoints(
+        lecture(), tmp_path / "pln_02_tiny.partial.jsonl", language="es"
+    )
+    checkpoint_path = tmp_path / "pln_01_tiny.partial.jsonl"
+    with pytest.raises(RuntimeError):
+        get_transcriber(FakeModel(max_calls=3)).transcribe_with_checkpoints(
+            lecture(), checkpoint_path, language="es"
+        )
+    model = FakeModel()
+    result = get_transcriber(model).transcribe_with_checkpoints(
+        lecture(), checkpoint_path, language="es"
+    )
+    assert get_words(result) == list(range(SECONDS))
+    # the three windows done before the kill aren't transcribed again
+    assert model.calls == uninterrupted.calls - 3
+
+
+def test_checkpoint_made_with_other_options_is_discarded(tmp_path):
+    checkpoint_path = tmp_path / "pln_01_tiny.partial.jsonl"
+    with pytest.raises(RuntimeError):
+        get_transcriber(FakeModel(max_calls=3)).transcribe_with_checkpoints(
+            lecture(), checkpoint_path, language="en"
+        )
+    result = get_transcriber(FakeModel()).transcribe_with_checkpoints(
+        lecture(), checkpoint_path, language="es"
+    )
+    assert get_words(result) == list(range(SECONDS))
+
+
+def test_split_window_moves_on_at_least_one_second():
+    near_start = [{"start": 0.1, "end": 0.4}, {"start": 0.2, "end": 0.6}]
+    assert split_window(near_start, 30, final=False) == (near_start, 30)
+    spanning = [{"start": 0.2, "end": 29.5}]
+    assert split_window(spanning, 30, final=False) == (spanning, 29.5)
+    several = [{"start": 0.2, "end": 12.0}, {"start": 12.5, "end": 29.9}]
+    assert split_window(several, 30, final=False) == (several[:1], 12.5)
+    assert split_window(several, 30, final=True) == (several, 30)
+
+
+def test_checkpoints_are_off_by_default():
+    assert Transcriber().checkpoint_seconds is None
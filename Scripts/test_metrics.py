@@ -0,0 +1,55 @@
+import json
+
+import jiwer as ji
+import pytest
+from metrics import aggregate_windows, evaluate_windows, normalize_text, parse_srt, read_segments
+
+SRT = """1
+00:00:00,000 --> 00:00:08,500
+Buenas tardes, hoy vamos a ver modelos de lenguaje.
+
+2
+00:00:08,500 --> 00:00:21,000
+Un modelo de lenguaje asigna una probabilidad a cada secuencia de palabras.
+
+3
+00:00:21,000 --> 00:00:33,000
+Empezamos por los modelos de n-gramas, que cuentan frecuencias en un corpus.
+"""
+
+# shifted and split differently from the subtitles, with substitutions, a deletion and insertions
+SEGMENTS = [
+    {"start": 0.4, "end": 10.2, "text": " Buenas tardes, hoy vamos a ver los modelos del lenguaje. Un"},
+    {"start": 10.2, "end": 19.0, "text": " modelo de lenguaje asigna probabilidad a cada secuencia de palabras"},
+    {"start": 19.0, "end": 34.5, "text": " empezamos eh por los modelos de engramas que cuentan frecuencias en un corpus"},
+]
+
+
+@pytest.fixture
+def lecture(tmp_path):
+    reference_path = tmp_path / "pln_01.srt"
+    reference_path.write_text(SRT, encoding="utf-8")
+    hypothesis_path = tmp_path / "pln_01_medium.json"
+    hypothesis_path.write_text(json.dumps({"segments": SEGMENTS}), encoding="utf-8")
+    return parse_srt(reference_path), read_segments(hypothesis_path)
+
+
+@pytest.mark.parametrize("window_seconds", [5, 10, 30, 60])
+def test_aggregate_equals_whole_file_wer(lecture, window_seconds):
+    reference, hypothesis = lecture
+    whole_file = ji.wer(
+        normalize_text(" ".join(text for _, _, text in reference)),
+        normalize_text(" ".join(text for _, _, text in hypothesis)),
+    )
+    windows = evaluate_windows(reference, hypothesis, window_seconds)
+    assert aggregate_windows(windows)["wer"] == pytest.approx(whole_file)
+    assert windows["hypothesis_words"].sum() == len(
+        normalize_text(" ".join(text for _, _, text in hypothesis)).split()
+    )
+
+
+def test_empty_hypothesis_is_all_deletions(lecture):
+    reference, _ = lecture
+    windows = evaluate_windows(reference, [], 10)
+    assert aggregate_windows(windows)["wer"] == 1
+    assert (windows["deletions"] == windows["reference_words"]).all()